@@ -5,8 +5,44 @@ class Config(object):
 
     LOGGING_LEVEL = "ERROR"
     LOGGING_FORMAT = '%(asctime)s - %(levelname)-7s - %(module)s:%(filename)s:%(lineno)d - %(message)s'
+    # Records below WARNING are limited per message template and interval, and can be sampled
+    LOGGING_RATE_LIMIT = 100
+    LOGGING_RATE_LIMIT_INTERVAL = 60
+    LOGGING_SAMPLE_RATES = {}
 
     COUNTRY_LOCATION_ID = 1
+    # Form fields are read from the Meerkat API when not defined in the settings file
+    FORM_DEFINITIONS = None
+    # Signal triggering a reload of form definitions and export config, e.g. "SIGUSR2". Disabled by default,
+    # uWSGI uses SIGHUP for graceful reloads of its workers. POST /dhis2/export/reload is the preferred way.
+    FORM_RELOAD_SIGNAL = None
+    # Create and update DHIS2 organisation units from the Meerkat location tree before exporting forms
+    SYNC_LOCATION_TREE_ON_START = False
+
+    DEDUP_CACHE_SIZE = 100000
+    DEDUP_WINDOW_SECONDS = 24 * 60 * 60
+    DEDUP_PERSISTENCE_FILE = None
+    DEDUP_PERSIST_INTERVAL_SECONDS = 60
+
+    # Writes beyond the DHIS2_WRITE_THREAD_COUNT environment variable (20 by default) queue up
+    # in their executor, so the ceiling is only reachable when it doesn't exceed that count
+    DHIS2_WRITE_CONCURRENCY_FLOOR = 1
+    DHIS2_WRITE_CONCURRENCY_CEILING = 20
+    DHIS2_WRITE_LATENCY_TARGET = 5.0
+
+    CIRCUIT_BREAKER_FAILURE_RATE = 0.5
+    CIRCUIT_BREAKER_MIN_REQUESTS = 10
+    CIRCUIT_BREAKER_WINDOW_SECONDS = 60
+    CIRCUIT_BREAKER_OPEN_SECONDS = 30
+    # Default connect and read timeout of upstream requests, so hanging hosts count as failures
+    UPSTREAM_REQUEST_TIMEOUT_SECONDS = (10, 120)
+
+    CAPTURE_SUBMISSIONS_FILE = None
+
+    BACKFILL_CHECKPOINT_FILE = "backfill_checkpoint.json"
+
+    # One of "json", "ujson" or "orjson", used to serialize DHIS2 payloads
+    JSON_CODEC = "json"
 
 
 
@@ -1,11 +1,14 @@
 import logging
 import os
+import signal
 from json.decoder import JSONDecodeError
 
 import backoff as backoff
 import requests
 from flask import Flask
 
+from meerkat_consul.log_handlers import StructuredFormatter, SamplingFilter, queue_handler
+
 app = Flask(__name__)
 app.config.from_object(os.getenv('CONFIG_OBJECT', 'config.Development'))
 app.config.from_pyfile(os.getenv('MEERKAT_CONSUL_SETTINGS'), silent=True)
@@ -13,9 +16,13 @@ app.config.from_pyfile(os.getenv('MEERKAT_CONSUL_SETTINGS'), silent=True)
 logger = logging.getLogger("meerkat_consul")
 logging_format = app.config['LOGGING_FORMAT']
 logging_level_ = app.config['LOGGING_LEVEL']
-handler = logging.StreamHandler()
-formatter = logging.Formatter(logging_format)
-handler.setFormatter(formatter)
+stream_handler = logging.StreamHandler()
+formatter = StructuredFormatter(logging_format)
+stream_handler.setFormatter(formatter)
+sampling_filter = SamplingFilter(rate_limit=app.config['LOGGING_RATE_LIMIT'],
+                                 interval=app.config['LOGGING_RATE_LIMIT_INTERVAL'],
+                                 sample_rates=app.config['LOGGING_SAMPLE_RATES'])
+handler = queue_handler(stream_handler, sampling_filter)
 level = logging.getLevelName(logging_level_)
 
 logger.setLevel(level)
@@ -52,9 +59,14 @@ def wait_for_api_start():
 wait_for_api_start()
 wait_for_api_init()
 
-from meerkat_consul.export import dhis2_export, export_form_fields
+from meerkat_consul.decorators import executor
+from meerkat_consul.export import dhis2_export, export_form_fields, reload_form_config
+from meerkat_consul.location_tree import sync_location_tree
+import meerkat_consul.backfill
 
 try:
+    if app.config['SYNC_LOCATION_TREE_ON_START']:
+        sync_location_tree()
     export_form_fields()
     app.register_blueprint(dhis2_export)
     enabled_ = True
@@ -63,15 +75,27 @@ except (ValueError, requests.exceptions.ConnectionError):
     logger.error("Consul won't work properly.", exc_info=True)
     enabled_ = False
 
+
+def reload_form_config_logging_errors():
+    try:
+        reload_form_config()
+    except Exception:
+        logger.exception("Failed to reload form configuration.")
+
+
+def reload_on_signal(signum, frame):
+    logger.info("Received signal %d, reloading form configuration.", signum)
+    executor.submit(reload_form_config_logging_errors)
+
+
+if enabled_ and app.config['FORM_RELOAD_SIGNAL']:
+    signal.signal(getattr(signal, app.config['FORM_RELOAD_SIGNAL']), reload_on_signal)
+
+
 @app.route('/')
 def root():
     return f"{{'name':'meerkat_consul', 'enabled':'{enabled_}'}}"
 
 
 if __name__ == '__main__':
-    # from meerkat_consul.export import ExportFormFields, ExportLocationTree
-    # ExportLocationTree().get()
-    # while(True):
-    #     ExportFormFields().get()
-    #
     app.run(host="0.0.0.0", debug=True, use_reloader=False)
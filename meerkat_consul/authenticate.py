@@ -15,7 +15,7 @@ consul_auth_token_ = ''
 
 
 def retry_message(i):
-    logger.debug("Failed to authenticate. Retrying in " + str(i))
+    logger.debug("Failed to authenticate. Retrying in %s", i)
 
 @backoff.on_exception(backoff.expo,
                       requests.exceptions.RequestException,
@@ -0,0 +1,93 @@
+import json
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from meerkat_consul import logger, api_url, app
+from meerkat_consul.authenticate import meerkat_headers
+from meerkat_consul.decorators import get
+from meerkat_consul.export import form_export_config, transform_submissions, send_events, send_data_value_set
+
+
+class BackfillCheckpoint:
+    """
+    Durable record of the next page to export for each form.
+    The file is replaced atomically so that an interrupted run never leaves a partial checkpoint.
+    """
+
+    def __init__(self, checkpoint_file):
+        self.checkpoint_file = checkpoint_file
+        self.pages = {}
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file) as f:
+                self.pages = json.load(f)
+
+    def next_page(self, form_name):
+        return self.pages.get(form_name, 1)
+
+    def save(self, form_name, next_page):
+        self.pages[form_name] = next_page
+        tmp_file = self.checkpoint_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.pages, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+
+def get_submissions_page_from_meerkat_api(form_name, page, page_size):
+    params = {"page": page, "per_page": page_size}
+    rv = get("{}/export/submissions/{}".format(api_url, form_name), params=params, headers=meerkat_headers())
+    return rv.json().get('submissions', [])
+
+
+def backfill_form(form_name, checkpoint, page_size=5000, chunk_size=1000, workers=4):
+    """
+    Streams all submissions of a form from the Meerkat API and exports them to DHIS2.
+    Only one page is held in memory at a time; its chunks are written by `workers` parallel
+    threads and the checkpoint is advanced once the whole page was accepted by DHIS2.
+    :return: Counter of skipped submissions by reason
+    """
+    export_type = form_export_config[form_name]["exportType"]
+    skipped = Counter()
+    page = checkpoint.next_page(form_name)
+    logger.info("Starting backfill of form %s from page %d.", form_name, page)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            submissions = get_submissions_page_from_meerkat_api(form_name, page, page_size)
+            if not submissions:
+                break
+            payloads, _ = transform_submissions(form_name, export_type, submissions, skipped)
+            if export_type == "event":
+                chunks = [{"events": payloads[i:i + chunk_size]} for i in range(0, len(payloads), chunk_size)]
+                responses = executor.map(send_events, chunks)
+            else:
+                responses = executor.map(send_data_value_set, payloads)
+            failed = [res.status_code for res in responses if res.status_code >= 300]
+            if failed:
+                raise click.ClickException(
+                    f"DHIS2 rejected {len(failed)} writes for page {page} of form {form_name}, rerun to resume.")
+            page += 1
+            checkpoint.save(form_name, page)
+            logger.info("Backfilled page %d of form %s (%d submissions).", page - 1, form_name, len(submissions))
+    logger.info("Finished backfill of form %s, skipped: %s", form_name, dict(skipped))
+    return skipped
+
+
+@app.cli.command('backfill')
+@click.argument('form_names', nargs=-1)
+@click.option('--checkpoint-file', default=lambda: app.config['BACKFILL_CHECKPOINT_FILE'],
+              help="File storing the next page to export for each form.")
+@click.option('--page-size', default=5000, help="Number of submissions requested from the Meerkat API at once.")
+@click.option('--chunk-size', default=1000, help="Number of events posted to DHIS2 in one request.")
+@click.option('--workers', default=4, help="Number of parallel DHIS2 writers.")
+def backfill(form_names, checkpoint_file, page_size, chunk_size, workers):
+    """Export historical submissions of given forms (all configured forms by default) to DHIS2."""
+    form_names = form_names or list(form_export_config.keys())
+    unsupported = [form_name for form_name in form_names if form_name not in form_export_config]
+    if unsupported:
+        raise click.ClickException(f"Forms {', '.join(unsupported)} are not supported.")
+    checkpoint = BackfillCheckpoint(checkpoint_file)
+    for form_name in form_names:
+        skipped = backfill_form(form_name, checkpoint, page_size=page_size, chunk_size=chunk_size, workers=workers)
+        click.echo(f"{form_name}: done, skipped {dict(skipped)}")
@@ -0,0 +1,25 @@
+import json
+import threading
+from time import time
+
+from meerkat_consul import logger
+
+
+class SubmissionRecorder:
+    """
+    Appends incoming submission batches to a JSONL file so that they can be replayed offline
+    with scripts/replay_submissions.py. Each line holds the arrival time and the posted body.
+    """
+
+    def __init__(self, capture_file):
+        self.capture_file = capture_file
+        self.__lock = threading.Lock()
+
+    def record(self, body):
+        line = json.dumps({"time": time(), "body": body})
+        with self.__lock:
+            try:
+                with open(self.capture_file, 'a') as f:
+                    f.write(line + "\n")
+            except OSError:
+                logger.error("Failed to capture submission batch to %s", self.capture_file, exc_info=True)
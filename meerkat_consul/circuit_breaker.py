@@ -0,0 +1,97 @@
+import threading
+from collections import deque
+from time import time
+
+from meerkat_consul import logger
+from meerkat_consul.errors import CircuitOpenError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Failure rate based circuit breaker for a single upstream host.
+
+    The breaker opens when at least `min_requests` requests were made in the last `window` seconds
+    and the share of failed ones reached `failure_rate`. While open, requests fail fast with
+    CircuitOpenError. After `open_seconds` a single probe request is let through; its outcome
+    either closes the breaker or opens it again. A probe without outcome after another `open_seconds`
+    counts as failed.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_requests=10, window=60, open_seconds=30):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = None
+        self.__outcomes = deque()
+        self.__probe_in_flight = False
+        self.__probe_started_at = None
+        self.__lock = threading.Lock()
+
+    def before_request(self):
+        with self.__lock:
+            if self.state == OPEN and time() - self.opened_at >= self.open_seconds:
+                logger.info("Circuit breaker for %s is half-open, sending probe request.", self.name)
+                self.state = HALF_OPEN
+                self.__probe_in_flight = False
+            elif self.state == HALF_OPEN and self.__probe_in_flight \
+                    and time() - self.__probe_started_at >= self.open_seconds:
+                logger.warning("Probe request to %s didn't finish in %ds.", self.name, self.open_seconds)
+                self.__open()
+            if self.state == OPEN or (self.state == HALF_OPEN and self.__probe_in_flight):
+                raise CircuitOpenError(f"Circuit breaker for {self.name} is open")
+            if self.state == HALF_OPEN:
+                self.__probe_in_flight = True
+                self.__probe_started_at = time()
+
+    def record_success(self):
+        with self.__lock:
+            if self.state == HALF_OPEN:
+                logger.info("Circuit breaker for %s closed.", self.name)
+                self.state = CLOSED
+                self.__outcomes.clear()
+                self.__probe_in_flight = False
+            self.__record(True)
+
+    def record_failure(self):
+        with self.__lock:
+            if self.state == HALF_OPEN:
+                self.__open()
+                return
+            self.__record(False)
+            failures = sum(1 for _, ok in self.__outcomes if not ok)
+            if self.state == CLOSED and len(self.__outcomes) >= self.min_requests \
+                    and failures / len(self.__outcomes) >= self.failure_rate:
+                self.__open()
+
+    def status(self):
+        with self.__lock:
+            self.__prune()
+            failures = sum(1 for _, ok in self.__outcomes if not ok)
+            return {
+                "state": self.state,
+                "opened_at": self.opened_at,
+                "requests": len(self.__outcomes),
+                "failures": failures
+            }
+
+    def __record(self, ok):
+        self.__outcomes.append((time(), ok))
+        self.__prune()
+
+    def __prune(self):
+        threshold = time() - self.window
+        while self.__outcomes and self.__outcomes[0][0] < threshold:
+            self.__outcomes.popleft()
+
+    def __open(self):
+        logger.error("Circuit breaker for %s opened.", self.name)
+        self.state = OPEN
+        self.opened_at = time()
+        self.__probe_in_flight = False
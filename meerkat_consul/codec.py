@@ -0,0 +1,62 @@
+import importlib
+import json
+
+from meerkat_consul import logger
+
+
+def __stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def __ujson_dumps(obj):
+    return importlib.import_module('ujson').dumps(obj).encode('utf-8')
+
+
+def __orjson_dumps(obj):
+    return importlib.import_module('orjson').dumps(obj)
+
+
+__codecs = {
+    'json': (None, __stdlib_dumps),
+    'ujson': ('ujson', __ujson_dumps),
+    'orjson': ('orjson', __orjson_dumps)
+}
+
+
+def get_dumps(codec_name):
+    """
+    Returns a function serializing objects to JSON bytes with given codec.
+    Falls back to the standard library if the codec's package is not installed.
+    :param codec_name: one of "json", "ujson" or "orjson"
+    :return: function
+    """
+    if codec_name not in __codecs:
+        raise ValueError(f"Unsupported JSON codec {codec_name}")
+    module_name, dumps = __codecs[codec_name]
+    if module_name:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            logger.warning("JSON codec %s is not installed, falling back to json.", codec_name)
+            return __stdlib_dumps
+    return dumps
+
+
+def stream_json_object(key, items, dumps=__stdlib_dumps, chunk_size=64 * 1024):
+    """
+    Encodes {key: [items...]} lazily, yielding chunks of roughly `chunk_size` bytes.
+    Passing the generator as request data makes requests send a chunked body, so the
+    serialized payload is never held in memory as a whole.
+    """
+    buffer = bytearray(b'{' + dumps(key) + b':[')
+    first = True
+    for item in items:
+        if not first:
+            buffer += b','
+        buffer += dumps(item)
+        first = False
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b']}'
+    yield bytes(buffer)
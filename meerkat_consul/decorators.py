@@ -1,16 +1,19 @@
 import os
 
+import threading
 import uuid
 from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from json import JSONDecodeError
 from time import time
+from urllib.parse import urlparse
 
 import requests
 from flask import current_app, request
 from werkzeug.exceptions import InternalServerError, HTTPException
 
-from meerkat_consul import logger
+from meerkat_consul import app, logger
+from meerkat_consul.circuit_breaker import CircuitBreaker
 
 
 def put(url, data=None, json=None, **kwargs):
@@ -22,7 +25,7 @@ def put(url, data=None, json=None, **kwargs):
     :param kwargs:
     :return: requests.Response
     """
-    response = requests.put(url, data=data, json=json, **kwargs)
+    response = __send(requests.put, url, data=data, json=json, **kwargs)
     return __check_if_response_is_ok(response)
 
 
@@ -35,7 +38,7 @@ def get(url, params=None, **kwargs):
     :param kwargs:
     :return: requests.Response
     """
-    response = requests.get(url, params=params, **kwargs)
+    response = __send(requests.get, url, params=params, **kwargs)
     return __check_if_response_is_ok(response)
 
 
@@ -48,7 +51,7 @@ def post(url, data=None, json=None, **kwargs):
     :param kwargs:
     :return: requests.Response
     """
-    response = requests.post(url, data=data, json=json, **kwargs)
+    response = __send(requests.post, url, data=data, json=json, **kwargs)
     return __check_if_response_is_ok(response)
 
 
@@ -61,16 +64,59 @@ def delete(url, **kwargs):
     :param kwargs:
     :return: requests.Response
     """
-    response = requests.delete(url, **kwargs)
+    response = __send(requests.delete, url, **kwargs)
     return __check_if_response_is_ok(response)
 
 
+circuit_breakers = {}
+__circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url):
+    """
+    Returns the circuit breaker guarding the host of given url
+    :param url:
+    :return: CircuitBreaker
+    """
+    host = urlparse(url).netloc
+    with __circuit_breakers_lock:
+        if host not in circuit_breakers:
+            circuit_breakers[host] = CircuitBreaker(host,
+                                                    failure_rate=app.config['CIRCUIT_BREAKER_FAILURE_RATE'],
+                                                    min_requests=app.config['CIRCUIT_BREAKER_MIN_REQUESTS'],
+                                                    window=app.config['CIRCUIT_BREAKER_WINDOW_SECONDS'],
+                                                    open_seconds=app.config['CIRCUIT_BREAKER_OPEN_SECONDS'])
+        return circuit_breakers[host]
+
+
+def circuit_breakers_status():
+    with __circuit_breakers_lock:
+        breakers = list(circuit_breakers.items())
+    return {host: breaker.status() for host, breaker in breakers}
+
+
+def __send(method, url, **kwargs):
+    circuit_breaker = get_circuit_breaker(url)
+    circuit_breaker.before_request()
+    kwargs.setdefault('timeout', app.config['UPSTREAM_REQUEST_TIMEOUT_SECONDS'])
+    try:
+        response = method(url, **kwargs)
+    except Exception:
+        circuit_breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        circuit_breaker.record_failure()
+    else:
+        circuit_breaker.record_success()
+    return response
+
+
 def __check_if_response_is_ok(response):
     if 200 < response.status_code >= 300:
         logger.error("Request failed with code %d.", response.status_code)
         try:
             logger.error(response.json().get("message"), stack_info=True)
-            logger.debug(response.text)
+            logger.debug("Response: %s", response.text)
         except JSONDecodeError:
             logger.error(response.text, stack_info=True)
     return response
@@ -79,12 +125,29 @@ def __check_if_response_is_ok(response):
 tasks = {}
 BACKGROUND_THREAD_COUNT = int(os.environ.get("BACKGROUND_THREAD_COUNT", "20"))
 executor = ThreadPoolExecutor(max_workers=BACKGROUND_THREAD_COUNT)
+# DHIS2 writes wait on the adaptive concurrency limiter, so they get their own threads and
+# can't starve other background tasks when the limit drops
+DHIS2_WRITE_THREAD_COUNT = int(os.environ.get("DHIS2_WRITE_THREAD_COUNT", "20"))
+dhis2_write_executor = ThreadPoolExecutor(max_workers=DHIS2_WRITE_THREAD_COUNT)
 
 def async(f):
     """
     This decorator transforms a sync route to asynchronous by running it
     in a background thread.
     """
+    return in_background(executor)(f)
+
+
+def in_background(task_executor):
+    """
+    Returns a decorator which, like `async`, runs the route in a thread of given executor.
+    """
+    def decorator(f):
+        return __run_in_background(f, task_executor)
+    return decorator
+
+
+def __run_in_background(f, task_executor):
     @wraps(f)
     def wrapped(*args, **kwargs):
         def task(app, environ):
@@ -111,8 +174,8 @@ def async(f):
         id = uuid.uuid4().hex
 
         # Record the task, and then launch it
-        logger.info("Starting background tasks with id: {}".format(id))
-        tasks[id] = {'task': executor.submit(task, current_app._get_current_object(), request.environ)}
+        logger.info("Starting background tasks with id: %s", id)
+        tasks[id] = {'task': task_executor.submit(task, current_app._get_current_object(), request.environ)}
 
         return '', 202, {'Location': id}
     return wrapped
\ No newline at end of file
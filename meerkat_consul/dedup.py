@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from time import time
+
+from meerkat_consul import logger
+
+
+class SubmissionDeduplicator:
+    """
+    Bounded LRU of recently exported submissions.
+
+    Entries are keyed on the DHIS2 uid of a submission and store a hash of its content,
+    so that a redelivered submission with unchanged content can be skipped within the
+    configured window. When a persistence file is given the LRU survives restarts; it is
+    rewritten at most once per `persist_interval` seconds unless persisting is forced.
+    """
+
+    def __init__(self, max_size=100000, window=86400, persistence_file=None, persist_interval=60):
+        self.max_size = max_size
+        self.window = window
+        self.persistence_file = persistence_file
+        self.persist_interval = persist_interval
+        self.skipped = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__persist_lock = threading.Lock()
+        self.__last_persisted = time()
+        if persistence_file:
+            self.__load()
+
+    @staticmethod
+    def content_hash(content):
+        serialized = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.md5(serialized.encode('utf-8')).hexdigest()
+
+    def is_duplicate(self, uid, content_hash):
+        with self.__lock:
+            entry = self.__entries.get(uid)
+            if not entry:
+                return False
+            seen_hash, seen_at = entry
+            if seen_hash != content_hash or time() - seen_at > self.window:
+                return False
+            self.__entries.move_to_end(uid)
+            self.skipped += 1
+            return True
+
+    def remember(self, uid, content_hash):
+        with self.__lock:
+            self.__entries[uid] = (content_hash, time())
+            self.__entries.move_to_end(uid)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def persist(self, force=False):
+        if not self.persistence_file:
+            return
+        with self.__persist_lock:
+            if not force and time() - self.__last_persisted < self.persist_interval:
+                return
+            self.__last_persisted = time()
+            with self.__lock:
+                entries = [[uid, content_hash, seen_at] for uid, (content_hash, seen_at) in self.__entries.items()]
+            directory = os.path.dirname(os.path.abspath(self.persistence_file))
+            try:
+                fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_file, self.persistence_file)
+            except OSError:
+                logger.error("Failed to persist deduplication cache to %s", self.persistence_file, exc_info=True)
+
+    def __load(self):
+        try:
+            with open(self.persistence_file) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.error("Failed to load deduplication cache from %s", self.persistence_file, exc_info=True)
+            return
+        now = time()
+        for uid, content_hash, seen_at in entries[-self.max_size:]:
+            if now - seen_at <= self.window:
+                self.__entries[uid] = (content_hash, seen_at)
+        logger.info("Loaded %d entries into deduplication cache.", len(self.__entries))
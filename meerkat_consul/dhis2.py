@@ -24,4 +24,31 @@ class NewIdsProvider:
 
 
 def transform_to_dhis2_code(input):
-    return hashlib.md5(input.encode('utf-8')).hexdigest()
\ No newline at end of file
+    return hashlib.md5(input.encode('utf-8')).hexdigest()
+
+def coalesce_data_value_sets(data_entries):
+    """
+    Merges data value set entries sharing the same data set, organisation unit and period.
+
+    :param data_entries: iterable of (submitted_at, uid, data_value_set) tuples
+    :return: list of consolidated data value sets, one per (dataSet, orgUnit, period)
+    """
+    groups = {}
+    # Later submissions overwrite earlier ones, uid breaks ties deterministically
+    for submitted_at, uid, data_value_set in sorted(data_entries, key=lambda entry: (entry[0], entry[1])):
+        group_key = (data_value_set['dataSet'], data_value_set['orgUnit'], data_value_set['period'])
+        group = groups.get(group_key)
+        if group is None:
+            group = {key: value for key, value in data_value_set.items() if key != 'dataValues'}
+            group['dataValues'] = {}
+            groups[group_key] = group
+        else:
+            group['completeDate'] = data_value_set.get('completeDate', group.get('completeDate'))
+        for data_value in data_value_set['dataValues']:
+            value_key = (data_value['dataElement'], data_value.get('categoryOptionCombo'))
+            group['dataValues'][value_key] = data_value
+    result = []
+    for group in groups.values():
+        group['dataValues'] = list(group['dataValues'].values())
+        result.append(group)
+    return result
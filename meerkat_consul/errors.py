@@ -1,2 +1,9 @@
+import requests
+
+
 class MissingCountryLocationIdError(ValueError):
-    pass
\ No newline at end of file
+    pass
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
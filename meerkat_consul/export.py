@@ -1,20 +1,27 @@
+import atexit
 import json
 import logging
-from collections import defaultdict
+import os
+import threading
+from collections import Counter, defaultdict
 from json import JSONDecodeError
 
 import backoff as backoff
 from datetime import datetime
-import requests
 from flask import Blueprint, jsonify
 from flask_restful import abort, reqparse
 
 from meerkat_consul import logger, api_url, app
 from meerkat_consul.auth_client import auth
+from meerkat_consul.capture import SubmissionRecorder
+from meerkat_consul.codec import get_dumps, stream_json_object
 from meerkat_consul.authenticate import meerkat_headers
-from meerkat_consul.decorators import get, post, put, async
-from meerkat_consul.dhis2 import NewIdsProvider, transform_to_dhis2_code
-from meerkat_consul.errors import MissingCountryLocationIdError
+from meerkat_consul.decorators import get, post, put, async, circuit_breakers_status, in_background, \
+    dhis2_write_executor
+from meerkat_consul.dedup import SubmissionDeduplicator
+from meerkat_consul.dhis2 import NewIdsProvider, transform_to_dhis2_code, coalesce_data_value_sets
+from meerkat_consul.errors import MissingCountryLocationIdError, CircuitOpenError
+from meerkat_consul.throttle import AdaptiveConcurrencyLimiter
 
 __codes_to_ids = {}
 dhis2_config = app.config['DHIS2_CONFIG']
@@ -25,6 +32,28 @@ dhis2_ids = NewIdsProvider(dhis2_api_url, dhis2_headers)
 
 form_export_config = app.config['FORM_EXPORT_CONFIG']
 
+# Fingerprints and definitions of forms as they were last exported to DHIS2
+form_fingerprints = {}
+exported_form_definitions = {}
+__reload_lock = threading.Lock()
+
+json_dumps = get_dumps(app.config['JSON_CODEC'])
+
+submission_deduplicator = SubmissionDeduplicator(max_size=app.config['DEDUP_CACHE_SIZE'],
+                                                 window=app.config['DEDUP_WINDOW_SECONDS'],
+                                                 persistence_file=app.config['DEDUP_PERSISTENCE_FILE'],
+                                                 persist_interval=app.config['DEDUP_PERSIST_INTERVAL_SECONDS'])
+atexit.register(submission_deduplicator.persist, force=True)
+
+submission_recorder = None
+if app.config['CAPTURE_SUBMISSIONS_FILE']:
+    logger.info("Capturing submission batches to %s", app.config['CAPTURE_SUBMISSIONS_FILE'])
+    submission_recorder = SubmissionRecorder(app.config['CAPTURE_SUBMISSIONS_FILE'])
+
+dhis2_write_limiter = AdaptiveConcurrencyLimiter(floor=app.config['DHIS2_WRITE_CONCURRENCY_FLOOR'],
+                                                 ceiling=app.config['DHIS2_WRITE_CONCURRENCY_CEILING'],
+                                                 latency_target=app.config['DHIS2_WRITE_LATENCY_TARGET'])
+
 dhis2_export = Blueprint('export', __name__, url_prefix='/dhis2/export')
 
 @dhis2_export.route('/hello')
@@ -33,16 +62,99 @@ def hello():
     return jsonify({"message": "HELLO!"})
 
 
+@dhis2_export.route('/status')
+def status():
+    return jsonify({
+        "circuit_breakers": circuit_breakers_status(),
+        "dhis2_write_limiter": dhis2_write_limiter.status(),
+        "deduplication": {
+            "size": len(submission_deduplicator),
+            "skipped": submission_deduplicator.skipped
+        }
+    })
+
+
+@dhis2_export.errorhandler(CircuitOpenError)
+def circuit_open(e):
+    logger.error("Request rejected: %s", e)
+    return jsonify({"message": str(e)}), 503
+
+
 def __abort_if_more_than_one(dhis2_country_details, dhis2_organisation_code):
     if len(dhis2_country_details) > 1:
         logger.error("Received more than one organisation for given code: %s", dhis2_organisation_code)
         abort(500)
 
 
-def export_form_fields():
-    form_configs = app.config['FORM_DEFINITIONS'] or __get_forms_from_meerkat_api()
+@dhis2_export.route('/reload', methods=['POST'])
+@auth.authorise()
+@async
+def reload():
+    """
+    Reloads form configuration in the background, exporting metadata of changed forms can take long.
+    Only the worker process handling the request is updated. When the service runs
+    with several worker processes, restart them (e.g. `uwsgi --reload`) or call this endpoint per worker.
+    """
+    changed_forms = reload_form_config()
+    return jsonify({"message": "Reloaded form configuration", "exported_forms": changed_forms})
+
+
+def form_fingerprint(form_config, export_config):
+    return transform_to_dhis2_code(json.dumps([form_config, export_config], sort_keys=True))
+
+
+def reload_form_config():
+    """
+    Re-reads FORM_DEFINITIONS and FORM_EXPORT_CONFIG and exports metadata of the forms whose
+    fingerprint changed since their last export.
+    :return: list of re-exported form names
+    """
+    with __reload_lock:
+        app.config.from_pyfile(os.getenv('MEERKAT_CONSUL_SETTINGS'), silent=True)
+        new_export_config = app.config['FORM_EXPORT_CONFIG']
+        for form_name in list(form_export_config):
+            if form_name not in new_export_config:
+                del form_export_config[form_name]
+                form_fingerprints.pop(form_name, None)
+                __invalidate_form_cache(form_name, exported_form_definitions.pop(form_name, []))
+        form_export_config.update(new_export_config)
+
+        form_configs = __get_form_definitions()
+        changed_forms = [form_name for form_name, export_config in form_export_config.items()
+                         if form_fingerprints.get(form_name) != form_fingerprint(form_configs.get(form_name),
+                                                                                 export_config)]
+        for form_name in changed_forms:
+            __invalidate_form_cache(form_name, exported_form_definitions.get(form_name, []))
+        logger.info("Form configuration reloaded, %d forms changed: %s", len(changed_forms), changed_forms)
+        export_form_fields(changed_forms, form_configs)
+        return changed_forms
+
+
+def __invalidate_form_cache(form_name, form_config):
+    caches = Dhis2CodesToIdsCache.caches
+    form_code = transform_to_dhis2_code(form_name)
+    caches['programs'].pop(form_code, None)
+    caches['dataSets'].pop(form_code, None)
+    for field_config in form_config:
+        for domain_type in ("TRACKER", "AGGREGATE"):
+            caches['dataElements'].pop(transform_to_dhis2_code(f"{domain_type}_{field_config['name']}"), None)
+
+
+def __get_form_definitions():
+    return app.config['FORM_DEFINITIONS'] or __get_forms_from_meerkat_api()
+
+
+def export_form_fields(form_names=None, form_configs=None):
+    """
+    Exports metadata of given forms (all configured forms by default) to DHIS2
+    :param form_names: names of forms to export
+    :param form_configs: form definitions, read from the config or Meerkat API if not given
+    """
+    if form_configs is None:
+        form_configs = __get_form_definitions()
     logger.info("Starting export of form metadata.")
-    for form_name, export_config in form_export_config.items():
+    for form_name in form_export_config if form_names is None else form_names:
+        export_config = form_export_config[form_name]
         form_config = form_configs.get(form_name)
         if not form_config:
             raise ValueError(f"Can't find fields for form {form_name}")
@@ -56,11 +168,13 @@ def export_form_fields():
         else:
             msg_ = f"Unsupported exportType {export_type} for {form_name}"
             raise ValueError(msg_)
+        form_fingerprints[form_name] = form_fingerprint(form_config, export_config)
+        exported_form_definitions[form_name] = form_config
     logger.info("Finished export of form metadata.")
 
 
 def __get_forms_from_meerkat_api():
-    return requests.get("{}/export/forms".format(api_url), headers=meerkat_headers()).json()
+    return get("{}/export/forms".format(api_url), headers=meerkat_headers()).json()
 
 
 def __update_dhis2_program(form_config, form_name):
@@ -145,8 +259,8 @@ def __update_dhis2_dataset(form_config, form_name):
         req = get("{}/dataSets/{}".format(dhis2_api_url, dataset_id), headers=dhis2_headers)
         old_organisation_ids = [x["id"] for x in req.json().get('organisationUnits', [])]
 
-        for id in old_organisation_ids:
-            logger.info("Found old organisationid %s: ", id)
+        logger.info("Found %d old organisation ids for data set %s", len(old_organisation_ids), form_name)
+        logger.debug("Old organisation ids: %s", old_organisation_ids)
 
         organisations = list(
             set(old_organisation_ids) | set(get_all_operational_clinics_as_dhis2_ids()))
@@ -192,7 +306,7 @@ def _create_data_elements(form_config, data_elements_type):
 
 @backoff.on_exception(backoff.expo, json.decoder.JSONDecodeError, max_tries=5, max_value=45, base=5)
 def get_all_operational_clinics_as_dhis2_ids():
-    locations = requests.get("{}/locations".format(api_url), headers=meerkat_headers()).json()
+    locations = get("{}/locations".format(api_url), headers=meerkat_headers()).json()
     for location in locations.values():
         if location.get('case_report') != 0 and location.get('level') == 'clinic' and location.get('country_location_id'):
             yield Dhis2CodesToIdsCache.get_organisation_id(location.get('country_location_id'))
@@ -225,19 +339,27 @@ def __update_data_elements(key, field_type='TEXY', domain_type="TRACKER"):
     post_res = post("{}/dataElements".format(dhis2_api_url), data=json_payload_flat, headers=dhis2_headers)
     if post_res.status_code >= 300:
         abort(500, message=f"Unable to create data element {key} - {domain_type}")
-    logger.info("Created data element \"{}\" with status {!r}".format(key, post_res.status_code))
+    logger.info("Created data element \"%s\" with status %r", key, post_res.status_code)
     return id
 
 
+def meerkat_date_to_datetime(meerkat_date):
+    try:
+        return datetime.strptime(meerkat_date, "%b %d, %Y %I:%M:%S %p")
+    except ValueError:
+        # Some submissions carry a 24 hour clock next to the AM/PM marker
+        return datetime.strptime(meerkat_date, "%b %d, %Y %H:%M:%S %p")
+
+
 def meerkat_to_dhis2_date_format(meerkat_date):
-    return datetime.strptime(meerkat_date, "%b %d, %Y %H:%M:%S %p").strftime("%Y-%m-%d")
+    return meerkat_date_to_datetime(meerkat_date).strftime("%Y-%m-%d")
 
 
 def meerkat_to_dhis2_period_date_format(meerkat_date, form_name):
     period = dhis2_config.get('data_set_period', {}).get(form_name, 'daily')
 
     if period == 'daily':
-        return datetime.strptime(meerkat_date, "%b %d, %Y %H:%M:%S %p").strftime("%Y%m%d")
+        return meerkat_date_to_datetime(meerkat_date).strftime("%Y%m%d")
     else:
         return None
 
@@ -246,9 +368,12 @@ def meerkat_to_dhis2_period_date_format(meerkat_date, form_name):
 @auth.authorise()
 def submissions():
     logger.debug("Starting event export.")
-    payload_array = []
+    skipped = Counter()
+    body = reqparse.request.get_json()
+    if submission_recorder:
+        submission_recorder.record(body)
     try:
-        json_request = json.loads(reqparse.request.get_json())
+        json_request = json.loads(body)
     except JSONDecodeError:
         logger.error("Failed to decode JSON body")
         abort(400, messages="Unable to parse posted JSON")
@@ -258,104 +383,163 @@ def submissions():
         logger.warning(msg)
         return jsonify({"message": msg}), 404
     export_type = form_export_config[form_name].get("exportType")
-    if export_type == "event":
-        for message in json_request['Messages']:
-            try:
-                case = message['Body']
-                case_data = case['data']
-                program = case['formId']
-                _uuid = case_data.get('meta/instanceID', 'Unknown')[-11:]
-            except (TypeError, KeyError, AttributeError):
-                logger.error("Failed to parse message for form %s", form_name)
-                logger.debug("Message: %s", message)
-                logger.exception("Exception details:")
-                continue
-            try:
-                date = meerkat_to_dhis2_date_format(case_data['SubmissionDate'])
-                event_id = uuid_to_dhis2_uid(_uuid)
-                data_values = [{'dataElement': Dhis2CodesToIdsCache.get_data_element_id(f"TRACKER_{i}"), 'value': v} for i, v in
-                               case['data'].items()]
-                country_location_id = MeerkatCache.get_location_from_deviceid(case_data['deviceid'])
-            except MissingCountryLocationIdError as e:
-                logger.error(e, exc_info=logger.getEffectiveLevel() == logging.DEBUG)
-                continue
-            except (TypeError, ValueError):
-                logger.warning("Failed to prepare data elements for uuid: %s in form %s", _uuid, form_name)
-                logger.exception("Exception details:")
-                continue
-            event_payload = {
-                'event': event_id,
-                'program': Dhis2CodesToIdsCache.get_program_id(program),
-                'orgUnit': Dhis2CodesToIdsCache.get_organisation_id(country_location_id),
-                'eventDate': date,
-                'completedDate': date,
-                'dataValues': data_values,
-                'status': 'COMPLETED'
-            }
-            payload_array.append(event_payload)
-        events_payload = {"events": payload_array}
-        post_events(events_payload)
-    elif export_type == "data_set":
-        for message in json_request['Messages']:
-            try:
-                data_entry = message['Body']
-                data_entry_content = data_entry['data']
-                form_name = data_entry['formId']
-                _uuid = data_entry_content.get('meta/instanceID')[-11:]
-            except (TypeError, KeyError, AttributeError):
-                logger.error("Failed to parse message for form %s", form_name)
-                logger.debug("Message: %s", message)
-                logger.exception("Exception details:")
-                continue
-            try:
-                country_location_id = MeerkatCache.get_location_from_deviceid(data_entry_content['deviceid'])
-                data_values = [{'dataElement': Dhis2CodesToIdsCache.get_data_element_id(f"AGGREGATE_{i}"), 'value': v} for i, v in
-                               data_entry_content.items()]
-                date = meerkat_to_dhis2_date_format(data_entry_content['SubmissionDate'])
-                period = meerkat_to_dhis2_period_date_format(data_entry_content['SubmissionDate'], form_name)
-                data_set_id = Dhis2CodesToIdsCache.get_data_set_id(form_name)
-                organisation_id = Dhis2CodesToIdsCache.get_organisation_id(country_location_id)
-            except MissingCountryLocationIdError as e:
-                logger.warning(e, exc_info=logger.getEffectiveLevel() == logging.DEBUG)
-                continue
-            except (ValueError, TypeError):
-                logger.error("Failed to prepare data elements for uuid: %s in form %s", _uuid, form_name)
-                logger.exception("Exception details:")
-                continue
-            data_set_payload = {
-                'dataSet': data_set_id,
-                'completeDate': date,
-                'period': period,
-                'orgUnit': organisation_id,
-                'dataValues': data_values
-            }
-            payload_array.append(data_set_payload)
-        data_sets_payload = {"data_entries": payload_array}
-        post_data_set(data_sets_payload)
-    else:
+    if export_type not in ("event", "data_set"):
         msg = f"Export for form {form_name} with type {export_type} nod defined."
         logger.error(msg)
         return jsonify({"message": msg}), 404
-    return jsonify({"message": "Sending submission batch finished successfully"}), 202
+    submission_bodies = []
+    for message in json_request['Messages']:
+        try:
+            submission_bodies.append(message['Body'])
+        except (TypeError, KeyError):
+            logger.debug("Failed to parse message for form %s: %s", form_name, message)
+            skipped['unparseable'] += 1
+    payload_array, exported_keys = transform_submissions(form_name, export_type, submission_bodies, skipped,
+                                                         deduplicator=submission_deduplicator)
+    if export_type == "event":
+        post_events({"events": payload_array}, exported_keys)
+    else:
+        post_data_set({"data_entries": payload_array}, exported_keys)
+    # Failures of single submissions are only logged at DEBUG level, the batch summary reports them
+    failed = sum(count for reason, count in skipped.items() if reason != 'duplicate')
+    logger.log(logging.WARNING if failed else logging.INFO, "Prepared submission batch for export.", extra={"fields": {
+        "form": form_name,
+        "received": len(json_request['Messages']),
+        "exported": len(exported_keys),
+        **{f"skipped_{reason}": count for reason, count in skipped.items()}
+    }})
+    return jsonify({
+        "message": "Sending submission batch finished successfully",
+        "skipped": dict(skipped)
+    }), 202
+
+
+def transform_submissions(form_name, export_type, submission_bodies, skipped, deduplicator=None):
+    """
+    Transforms Meerkat submissions of a form to DHIS2 payloads
+    :param form_name: name of the form the submissions belong to
+    :param export_type: "event" or "data_set"
+    :param submission_bodies: iterable of submissions, each with `formId` and `data` keys
+    :param skipped: Counter updated with the reasons of skipped submissions
+    :param deduplicator: optional SubmissionDeduplicator used to skip unchanged submissions
+    :return: tuple of DHIS2 events or coalesced data value sets and (uid, content hash) pairs of included submissions
+    """
+    payload_array = []
+    exported_keys = []
+    if export_type == "event":
+        prepare = _prepare_event
+    elif export_type == "data_set":
+        prepare = _prepare_data_entry
+    else:
+        raise ValueError(f"Unsupported exportType {export_type} for {form_name}")
+    for submission in submission_bodies:
+        try:
+            submission_data = submission['data']
+            _uuid = submission_data.get('meta/instanceID')[-11:]
+        except (TypeError, KeyError, AttributeError):
+            logger.debug("Failed to parse message for form %s: %s", form_name, submission, exc_info=True)
+            skipped['unparseable'] += 1
+            continue
+        uid = uuid_to_dhis2_uid(_uuid)
+        content_hash = SubmissionDeduplicator.content_hash(submission)
+        if deduplicator is not None and deduplicator.is_duplicate(uid, content_hash):
+            skipped['duplicate'] += 1
+            continue
+        try:
+            payload = prepare(submission, uid)
+        except MissingCountryLocationIdError as e:
+            logger.debug("Skipping submission %s: %s", _uuid, e)
+            skipped['missing_location'] += 1
+            continue
+        except (KeyError, TypeError, ValueError):
+            logger.debug("Failed to prepare data elements for uuid: %s in form %s", _uuid, form_name, exc_info=True)
+            skipped['invalid_data'] += 1
+            continue
+        payload_array.append(payload)
+        exported_keys.append((uid, content_hash))
+    if export_type == "data_set":
+        coalesced_entries = coalesce_data_value_sets(payload_array)
+        logger.debug("Coalesced %d data entries into %d data value sets", len(payload_array), len(coalesced_entries))
+        payload_array = coalesced_entries
+    return payload_array, exported_keys
+
+
+def _prepare_event(case, event_id):
+    case_data = case['data']
+    date = meerkat_to_dhis2_date_format(case_data['SubmissionDate'])
+    data_values = [{'dataElement': Dhis2CodesToIdsCache.get_data_element_id(f"TRACKER_{i}"), 'value': v} for i, v in
+                   case_data.items()]
+    country_location_id = MeerkatCache.get_location_from_deviceid(case_data['deviceid'])
+    return {
+        'event': event_id,
+        'program': Dhis2CodesToIdsCache.get_program_id(case['formId']),
+        'orgUnit': Dhis2CodesToIdsCache.get_organisation_id(country_location_id),
+        'eventDate': date,
+        'completedDate': date,
+        'dataValues': data_values,
+        'status': 'COMPLETED'
+    }
 
 
-@async
-def post_events(events_payload):
-    event_res = post("{}/events?importStrategy=CREATE_AND_UPDATE".format(dhis2_api_url), headers=dhis2_headers,
-                     data=json.dumps(events_payload))
+def _prepare_data_entry(data_entry, entry_id):
+    data_entry_content = data_entry['data']
+    form_name = data_entry['formId']
+    country_location_id = MeerkatCache.get_location_from_deviceid(data_entry_content['deviceid'])
+    data_values = [{'dataElement': Dhis2CodesToIdsCache.get_data_element_id(f"AGGREGATE_{i}"), 'value': v} for i, v in
+                   data_entry_content.items()]
+    submitted_at = meerkat_date_to_datetime(data_entry_content['SubmissionDate'])
+    data_set_payload = {
+        'dataSet': Dhis2CodesToIdsCache.get_data_set_id(form_name),
+        'completeDate': meerkat_to_dhis2_date_format(data_entry_content['SubmissionDate']),
+        'period': meerkat_to_dhis2_period_date_format(data_entry_content['SubmissionDate'], form_name),
+        'orgUnit': Dhis2CodesToIdsCache.get_organisation_id(country_location_id),
+        'dataValues': data_values
+    }
+    return submitted_at, entry_id, data_set_payload
+
+
+def send_events(events_payload):
+    # Streamed as a chunked body, the serialized batch is never held in memory as a whole
+    body = stream_json_object("events", events_payload["events"], dumps=json_dumps)
+    event_res = dhis2_write_limiter.call(post, "{}/events?importStrategy=CREATE_AND_UPDATE".format(dhis2_api_url),
+                                         headers=dhis2_headers, data=body)
     logger.info("Send batch of events with status: %d", event_res.status_code)
     logger.debug("Message: %s", event_res.json().get('message'))
+    return event_res
 
 
-@async
-def post_data_set(data_sets_payload):
+def send_data_value_set(data_set):
+    data_set_res = dhis2_write_limiter.call(post,
+                                            "{}/dataValueSets?importStrategy=CREATE_AND_UPDATE".format(dhis2_api_url),
+                                            headers=dhis2_headers, data=json_dumps(data_set))
+    logger.info("Send batch of data entries with status: %d", data_set_res.status_code)
+    msg_ = data_set_res.json().get('message')
+    if msg_:
+        logger.debug("With message: %s", msg_)
+    return data_set_res
+
+
+@in_background(dhis2_write_executor)
+def post_events(events_payload, exported_keys=()):
+    event_res = send_events(events_payload)
+    if event_res.status_code < 300:
+        __remember_exported(exported_keys)
+
+
+@in_background(dhis2_write_executor)
+def post_data_set(data_sets_payload, exported_keys=()):
+    all_succeeded = True
     for data_set in data_sets_payload['data_entries']:
-        data_set_res = post("{}/dataValueSets?importStrategy=CREATE_AND_UPDATE".format(dhis2_api_url),
-                            headers=dhis2_headers, data=json.dumps(data_set))
-        logger.info("Send batch of data entries with status: %d", data_set_res.status_code)
-        msg_ = data_set_res.json().get('message')
-        if msg_:
-            logger.debug(f"With message: {msg_}")
+        data_set_res = send_data_value_set(data_set)
+        all_succeeded = all_succeeded and data_set_res.status_code < 300
+    if all_succeeded:
+        __remember_exported(exported_keys)
+
+
+def __remember_exported(exported_keys):
+    for uid, content_hash in exported_keys:
+        submission_deduplicator.remember(uid, content_hash)
+    submission_deduplicator.persist()
 
 
 def uuid_to_dhis2_uid(uuid):
@@ -379,7 +563,7 @@ class MeerkatCache():
         cache = MeerkatCache.caches[resource_name]
         if not cache.get(deviceid):
             url = "{}/{}/{}".format(api_url, resource_name, deviceid)
-            req = requests.get(url)
+            req = get(url)
             country_location_id = req.json().get('country_location_id')
             if not country_location_id:
                 raise MissingCountryLocationIdError(f"Failed to get country location id for device: {deviceid}")
@@ -423,7 +607,7 @@ class Dhis2CodesToIdsCache():
     def get_and_cache_value(dhis2_resource, dhis2_code):
         cache = Dhis2CodesToIdsCache.caches[dhis2_resource]
         if not cache.get(dhis2_code):
-            logger.info("{} with code {} not found in cache.".format(dhis2_resource, dhis2_code))
+            logger.debug("%s with code %s not found in cache.", dhis2_resource, dhis2_code)
             rv = get("{url}/{resource_path}?filter=code:eq:{code}".format(
                 url=dhis2_api_url,
                 resource_path=dhis2_resource,
@@ -433,6 +617,6 @@ class Dhis2CodesToIdsCache():
             if not dhis2_objects or len(dhis2_objects) == 0:
                 raise ValueError("{} with code {} not found in DHIS2".format(dhis2_resource, dhis2_code))
             elif len(dhis2_objects) != 1:
-                logger.error("Found more then one dhis2 {} for code: {}".format(dhis2_resource, dhis2_code))
+                logger.error("Found more then one dhis2 %s for code: %s", dhis2_resource, dhis2_code)
             cache[dhis2_code] = dhis2_objects[0]["id"]
         return cache.get(dhis2_code)
@@ -0,0 +1,165 @@
+from flask import jsonify
+
+from meerkat_consul import logger, api_url, app
+from meerkat_consul.auth_client import auth
+from meerkat_consul.authenticate import meerkat_headers
+from meerkat_consul.decorators import get, post, async
+from meerkat_consul.dhis2 import transform_to_dhis2_code
+from meerkat_consul.export import dhis2_export, dhis2_api_url, dhis2_headers, dhis2_ids, Dhis2CodesToIdsCache, \
+    json_dumps
+
+DEFAULT_OPENING_DATE = "1970-01-01"
+
+
+def location_to_dhis2_code(location):
+    """
+    Clinics are identified in DHIS2 by their country location id, other levels of the tree by their Meerkat id.
+    """
+    return location.get('country_location_id') or transform_to_dhis2_code(f"LOCATION_{location['id']}")
+
+
+def sort_parents_first(locations):
+    """
+    :param locations: dict of Meerkat location id to location
+    :return: list of locations ordered so that every parent precedes its children
+    """
+    depths = {}
+
+    def depth(location_id, visited=()):
+        if location_id in depths:
+            return depths[location_id]
+        parent_id = locations[location_id].get('parent_location')
+        if parent_id is None or parent_id not in locations or parent_id in visited:
+            result = 0
+        else:
+            result = depth(parent_id, visited + (location_id,)) + 1
+        depths[location_id] = result
+        return result
+
+    return sorted(locations.values(), key=lambda location: (depth(location['id']), location['id']))
+
+
+def diff_location_tree(locations, dhis2_organisation_units, country_location_id, new_id=dhis2_ids.pop):
+    """
+    Compares the Meerkat location tree with DHIS2 organisation units.
+
+    The Meerkat country location is mapped to the existing DHIS2 root unit, if there is one. Missing levels
+    above clinics are only created when a new clinic needs them, and existing units are only moved when their
+    current parent is a unit created from the Meerkat tree, so a manually built hierarchy is kept intact.
+    :param locations: dict of Meerkat location id to location
+    :param dhis2_organisation_units: list of DHIS2 organisation units with id, code, name and parent
+    :param country_location_id: Meerkat id of the country location
+    :param new_id: function providing uids for organisation units missing in DHIS2
+    :return: tuple of organisation units to create or update (parents first) and a code to uid mapping of all units
+    """
+    existing = {unit['code']: unit for unit in dhis2_organisation_units if unit.get('code')}
+    locations = {location['id']: location for location in locations.values()}
+    ordered_locations = sort_parents_first(locations)
+    codes = {location['id']: location_to_dhis2_code(location) for location in ordered_locations}
+    meerkat_codes = set(codes.values())
+    managed_ids = {unit['id'] for unit in dhis2_organisation_units if unit.get('code') in meerkat_codes}
+
+    country = locations.get(country_location_id)
+    roots = [unit for unit in dhis2_organisation_units if not unit.get('parent')]
+    if country and codes[country['id']] not in existing and len(roots) == 1:
+        existing[codes[country['id']]] = roots[0]
+
+    # Missing clinics are created, missing upper levels only when one of their descendants is
+    to_create = set()
+    for location in reversed(ordered_locations):
+        code = codes[location['id']]
+        if code in existing:
+            continue
+        if location.get('country_location_id') or location.get('level') == 'clinic' or location['id'] in to_create:
+            to_create.add(location['id'])
+            if location.get('parent_location') in locations:
+                to_create.add(location['parent_location'])
+    to_create = {location_id for location_id in to_create if codes[location_id] not in existing}
+
+    codes_to_ids = {code: unit['id'] for code, unit in existing.items()}
+    changed = []
+    for location in ordered_locations:
+        code = codes[location['id']]
+        unit = existing.get(code)
+        if not unit and location['id'] not in to_create:
+            continue
+        parent_location_id = location.get('parent_location')
+        parent_code = codes.get(parent_location_id)
+        parent_id = codes_to_ids.get(parent_code) if parent_code else None
+        if not unit and parent_location_id in locations and not parent_id:
+            logger.warning("Can't map parent of location %s, skipping it.", location['id'])
+            continue
+        if unit:
+            current_parent_id = (unit.get('parent') or {}).get('id')
+            if location['id'] == country_location_id or current_parent_id not in managed_ids or not parent_id:
+                # Keep the position of the root and of units placed under a parent not managed by Meerkat
+                parent_id = current_parent_id
+            if unit.get('name') == location['name'] and current_parent_id == parent_id:
+                continue
+            if location['id'] == country_location_id:
+                continue
+        uid = unit['id'] if unit else new_id()
+        codes_to_ids[code] = uid
+        organisation_unit = {
+            'id': uid,
+            'code': unit['code'] if unit else code,
+            'name': location['name'],
+            'shortName': location['name'][:50],
+            'openingDate': (unit or {}).get('openingDate') or location.get('start_date') or DEFAULT_OPENING_DATE
+        }
+        if parent_id:
+            organisation_unit['parent'] = {'id': parent_id}
+        changed.append(organisation_unit)
+    return changed, codes_to_ids
+
+
+def failed_import_ids(import_report):
+    """
+    :param import_report: DHIS2 metadata import report
+    :return: set of uids of objects DHIS2 failed to import
+    """
+    import_report = import_report.get('response', import_report)
+    failed = set()
+    for type_report in import_report.get('typeReports', []):
+        for object_report in type_report.get('objectReports', []):
+            if object_report.get('errorReports'):
+                failed.add(object_report.get('uid'))
+                logger.error("Failed to import organisation unit %s: %s", object_report.get('uid'),
+                             [error.get('message') for error in object_report['errorReports']])
+    return failed
+
+
+def sync_location_tree():
+    """
+    Creates or updates DHIS2 organisation units that differ from the Meerkat location tree
+    in a single metadata import and primes the organisation unit cache with the result.
+    :return: number of created or updated organisation units
+    """
+    locations = get("{}/locations".format(api_url), headers=meerkat_headers()).json()
+    rv = get("{}/organisationUnits?paging=false&fields=id,code,name,openingDate,parent[id]".format(dhis2_api_url),
+             headers=dhis2_headers)
+    organisation_units = rv.json().get('organisationUnits', [])
+    changed, codes_to_ids = diff_location_tree(locations, organisation_units, app.config['COUNTRY_LOCATION_ID'])
+    if changed:
+        res = post("{}/metadata?importStrategy=CREATE_AND_UPDATE&atomicMode=NONE".format(dhis2_api_url),
+                   headers=dhis2_headers, data=json_dumps({'organisationUnits': changed}))
+        logger.info("Imported %d organisation units with status %d", len(changed), res.status_code)
+        if res.status_code >= 300:
+            raise ValueError(f"Failed to import organisation units, DHIS2 responded with {res.status_code}")
+        # With atomicMode=NONE single units can be rejected while the import as a whole succeeds
+        failed = failed_import_ids(res.json())
+        existing_ids = {unit['id'] for unit in organisation_units}
+        codes_to_ids = {code: uid for code, uid in codes_to_ids.items() if uid not in failed or uid in existing_ids}
+        changed = [unit for unit in changed if unit['id'] not in failed]
+    else:
+        logger.info("Organisation units are up to date.")
+    Dhis2CodesToIdsCache.caches['organisationUnits'].update(codes_to_ids)
+    return len(changed)
+
+
+@dhis2_export.route('/locationTree', methods=['POST'])
+@auth.authorise()
+@async
+def location_tree():
+    changed = sync_location_tree()
+    return jsonify({"message": f"Synchronised {changed} organisation units"})
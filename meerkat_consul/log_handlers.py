@@ -0,0 +1,127 @@
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from time import time
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Appends structured fields passed with `extra={"fields": {...}}` to the formatted message as key=value pairs.
+    """
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message += f" suppressed_similar={suppressed}"
+        return message
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate limits and samples records below WARNING level per message template.
+
+    At most `rate_limit` records of each template are let through per `interval` seconds; the number
+    of dropped records is attached to the next record of that template that passes. `sample_rates`
+    maps message templates to the fraction of their records that should be kept. At most
+    `max_templates` windows are tracked, expired ones are evicted first.
+    """
+
+    def __init__(self, rate_limit=100, interval=60, sample_rates=None, max_templates=1000):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.interval = interval
+        self.sample_rates = sample_rates or {}
+        self.max_templates = max_templates
+        self.__windows = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        template = str(record.msg)
+        sample_rate = self.sample_rates.get(template)
+        if sample_rate is not None and random.random() >= sample_rate:
+            return False
+        now = time()
+        with self.__lock:
+            window_start, count, suppressed = self.__windows.get(template, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if self.rate_limit and count >= self.rate_limit:
+                self.__windows[template] = (window_start, count, suppressed + 1)
+                return False
+            self.__windows[template] = (window_start, count + 1, 0)
+            if len(self.__windows) > self.max_templates:
+                self.__evict(now)
+        record.suppressed = suppressed
+        return True
+
+    def tracked_templates(self):
+        return len(self.__windows)
+
+    def __evict(self, now):
+        expired = [template for template, (window_start, _, _) in self.__windows.items()
+                   if now - window_start >= self.interval]
+        for template in expired:
+            del self.__windows[template]
+        while len(self.__windows) > self.max_templates:
+            del self.__windows[next(iter(self.__windows))]
+
+
+class ProcessLocalQueueHandler(QueueHandler):
+    """
+    Enqueues records for a listener thread which writes them with `handler`.
+
+    The listener is started lazily by the first record emitted in each process, so that worker
+    processes forked after the app was loaded (e.g. by uWSGI) get a running listener of their own.
+    """
+
+    def __init__(self, handler):
+        super().__init__(queue.Queue(-1))
+        self.handler = handler
+        self.__pid = None
+        self.__listener = None
+        self.__listener_lock = threading.Lock()
+
+    def emit(self, record):
+        if self.__pid != os.getpid():
+            self.__start_listener()
+        super().emit(record)
+
+    def __start_listener(self):
+        with self.__listener_lock:
+            if self.__pid == os.getpid():
+                return
+            # Records and locks inherited from the parent process are not ours to consume
+            self.queue = queue.Queue(-1)
+            self.__listener = QueueListener(self.queue, self.handler, respect_handler_level=True)
+            self.__listener.start()
+            self.__pid = os.getpid()
+
+    def close(self):
+        # Called by logging.shutdown at exit, drains the queue of this process before closing
+        with self.__listener_lock:
+            if self.__listener and self.__pid == os.getpid():
+                self.__listener.stop()
+            self.__listener = None
+            self.__pid = None
+        super().close()
+
+
+def queue_handler(handler, sampling_filter=None):
+    """
+    Wraps `handler` so that records are only enqueued in the logging thread and emitted
+    by a background listener thread.
+    :return: QueueHandler to be added to loggers
+    """
+    non_blocking_handler = ProcessLocalQueueHandler(handler)
+    if sampling_filter is not None:
+        non_blocking_handler.addFilter(sampling_filter)
+    return non_blocking_handler
@@ -0,0 +1,67 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+import click
+
+from meerkat_consul.backfill import BackfillCheckpoint, backfill_form
+
+
+class BackfillTestCase(TestCase):
+    """
+    Unit tests for checkpointed backfill of historical submissions
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_file = os.path.join(self.tmp_dir.name, "checkpoint.json")
+        self.pages = {1: [{"id": 1}], 2: [{"id": 2}], 3: [{"id": 3}]}
+        self.requested_pages = []
+
+        def get_page(form_name, page, page_size):
+            self.requested_pages.append(page)
+            return self.pages.get(page, [])
+
+        patchers = [
+            patch.dict('meerkat_consul.backfill.form_export_config', {"demo_case": {"exportType": "event"}}),
+            patch('meerkat_consul.backfill.get_submissions_page_from_meerkat_api', side_effect=get_page),
+            patch('meerkat_consul.backfill.transform_submissions',
+                  side_effect=lambda form_name, export_type, submissions, skipped: (submissions, []))
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def __response(self, status_code):
+        response = MagicMock('requests.Response')
+        response.status_code = status_code
+        return response
+
+    def test_checkpoint_should_survive_reload(self):
+        checkpoint = BackfillCheckpoint(self.checkpoint_file)
+        self.assertEqual(checkpoint.next_page("demo_case"), 1)
+        checkpoint.save("demo_case", 3)
+        self.assertEqual(BackfillCheckpoint(self.checkpoint_file).next_page("demo_case"), 3)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["checkpoint.json"])
+
+    @patch('meerkat_consul.backfill.send_events')
+    def test_should_resume_from_saved_page(self, send_events_mock):
+        send_events_mock.return_value = self.__response(200)
+        BackfillCheckpoint(self.checkpoint_file).save("demo_case", 2)
+
+        backfill_form("demo_case", BackfillCheckpoint(self.checkpoint_file), workers=1)
+
+        self.assertEqual(self.requested_pages, [2, 3, 4])
+        self.assertEqual(send_events_mock.call_count, 2)
+        self.assertEqual(BackfillCheckpoint(self.checkpoint_file).next_page("demo_case"), 4)
+
+    @patch('meerkat_consul.backfill.send_events')
+    def test_should_not_advance_checkpoint_when_write_is_rejected(self, send_events_mock):
+        send_events_mock.side_effect = [self.__response(200), self.__response(409)]
+
+        with self.assertRaises(click.ClickException):
+            backfill_form("demo_case", BackfillCheckpoint(self.checkpoint_file), workers=1)
+
+        self.assertEqual(BackfillCheckpoint(self.checkpoint_file).next_page("demo_case"), 2)
@@ -0,0 +1,68 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from meerkat_consul.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from meerkat_consul.errors import CircuitOpenError
+
+
+class CircuitBreakerTestCase(TestCase):
+    """
+    Unit tests for the upstream circuit breaker
+    """
+
+    def setUp(self):
+        self.breaker = CircuitBreaker("dhis2", failure_rate=0.5, min_requests=4, window=60, open_seconds=30)
+
+    def __fail(self, times):
+        for _ in range(times):
+            self.breaker.before_request()
+            self.breaker.record_failure()
+
+    def test_should_stay_closed_below_min_requests(self):
+        self.__fail(3)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_should_stay_closed_below_failure_rate(self):
+        for _ in range(3):
+            self.breaker.record_success()
+        self.__fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_should_open_and_fail_fast(self):
+        self.__fail(4)
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+
+    def test_should_close_after_successful_probe(self):
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1000):
+            self.__fail(4)
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1031):
+            self.breaker.before_request()
+            self.assertEqual(self.breaker.state, HALF_OPEN)
+            with self.assertRaises(CircuitOpenError):
+                self.breaker.before_request()
+            self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_should_reopen_after_failed_probe(self):
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1000):
+            self.__fail(4)
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1031):
+            self.breaker.before_request()
+            self.breaker.record_failure()
+            self.assertEqual(self.breaker.state, OPEN)
+            self.assertEqual(self.breaker.status()["opened_at"], 1031)
+
+    def test_should_reopen_when_probe_hangs(self):
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1000):
+            self.__fail(4)
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1031):
+            self.breaker.before_request()
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1061):
+            with self.assertRaises(CircuitOpenError):
+                self.breaker.before_request()
+            self.assertEqual(self.breaker.state, OPEN)
+        with patch('meerkat_consul.circuit_breaker.time', return_value=1091):
+            self.breaker.before_request()
+            self.assertEqual(self.breaker.state, HALF_OPEN)
@@ -0,0 +1,39 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch
+
+from meerkat_consul.codec import get_dumps, stream_json_object
+
+
+class CodecTestCase(TestCase):
+    """
+    Unit tests for JSON serialization of DHIS2 payloads
+    """
+
+    def setUp(self):
+        self.events = [{"event": f"X{i:010d}", "dataValues": [{"dataElement": "de", "value": i}]} for i in range(100)]
+
+    def test_stream_should_produce_valid_json(self):
+        body = b"".join(stream_json_object("events", iter(self.events)))
+        self.assertEqual(json.loads(body.decode('utf-8')), {"events": self.events})
+
+    def test_stream_should_split_into_chunks(self):
+        chunks = list(stream_json_object("events", self.events, chunk_size=256))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(b"".join(chunks).decode('utf-8')), {"events": self.events})
+
+    def test_stream_of_no_items(self):
+        body = b"".join(stream_json_object("events", []))
+        self.assertEqual(json.loads(body.decode('utf-8')), {"events": []})
+
+    def test_should_fall_back_to_json_when_codec_is_missing(self):
+        with patch('meerkat_consul.codec.importlib.import_module', side_effect=ImportError("No module named 'orjson'")):
+            with self.assertLogs('meerkat_consul', level='WARNING') as cm:
+                dumps = get_dumps("orjson")
+        self.assertIs(dumps, get_dumps("json"))
+        self.assertIn("orjson is not installed", cm.output[0])
+        self.assertEqual(json.loads(dumps({"a": 1}).decode('utf-8')), {"a": 1})
+
+    def test_should_reject_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            get_dumps("yaml")
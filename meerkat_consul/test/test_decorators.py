@@ -1,6 +1,8 @@
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 
+import requests
+
 import meerkat_consul.decorators as decorators
 
 
@@ -11,6 +13,7 @@ class RequestsTestCase(TestCase):
 
     def setUp(self):
         self.kwargs = {"they": "shall", "pass": "ok"}
+        self.expected_kwargs = dict(self.kwargs, timeout=decorators.app.config['UPSTREAM_REQUEST_TIMEOUT_SECONDS'])
         self.fake_url = "http://foo"
         self.bar = "bar"
         self.baz = "baz"
@@ -19,25 +22,25 @@ class RequestsTestCase(TestCase):
     def test_put(self, requests_mock):
         self.__mock_ok_response(requests_mock)
         decorators.put(self.fake_url, data=self.bar, json=self.baz, **self.kwargs)
-        requests_mock.assert_called_once_with(self.fake_url, data=self.bar, json=self.baz, **self.kwargs)
+        requests_mock.assert_called_once_with(self.fake_url, data=self.bar, json=self.baz, **self.expected_kwargs)
 
     @patch('requests.post')
     def test_post(self, requests_mock):
         self.__mock_ok_response(requests_mock)
         decorators.post(self.fake_url, data=self.bar, json=self.baz, **self.kwargs)
-        requests_mock.assert_called_once_with(self.fake_url, data=self.bar, json=self.baz, **self.kwargs)
+        requests_mock.assert_called_once_with(self.fake_url, data=self.bar, json=self.baz, **self.expected_kwargs)
 
     @patch('requests.get')
     def test_get(self, requests_mock):
         self.__mock_ok_response(requests_mock)
         decorators.get(self.fake_url, params=self.bar, **self.kwargs)
-        requests_mock.assert_called_once_with(self.fake_url, params=self.bar, **self.kwargs)
+        requests_mock.assert_called_once_with(self.fake_url, params=self.bar, **self.expected_kwargs)
 
     @patch('requests.delete')
     def test_delete(self, requests_mock):
         self.__mock_ok_response(requests_mock)
         decorators.delete(self.fake_url, **self.kwargs)
-        requests_mock.assert_called_once_with(self.fake_url, **self.kwargs)
+        requests_mock.assert_called_once_with(self.fake_url, **self.expected_kwargs)
 
     @patch('requests.Response')
     @patch('requests.get')
@@ -50,6 +53,13 @@ class RequestsTestCase(TestCase):
             self.assertEqual(cm.output[0], 'ERROR:meerkat_consul:Request failed with code 999.')
             self.assertTrue("Error 999" in cm.output[1])
 
+    @patch('requests.get', side_effect=requests.exceptions.Timeout())
+    def test_should_count_timeouts_as_failures(self, requests_mock):
+        url = "http://hanging.example.org/api/programs"
+        with self.assertRaises(requests.exceptions.Timeout):
+            decorators.get(url)
+        self.assertEqual(decorators.get_circuit_breaker(url).status()["failures"], 1)
+
     def __mock_ok_response(self, requests_mock):
         response = MagicMock('requests.Response')
         response.status_code = 200
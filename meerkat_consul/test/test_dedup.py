@@ -0,0 +1,84 @@
+import os
+import tempfile
+import threading
+from time import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from meerkat_consul.dedup import SubmissionDeduplicator
+
+
+class SubmissionDeduplicatorTestCase(TestCase):
+    """
+    Unit tests for the submission deduplication cache
+    """
+
+    def setUp(self):
+        self.deduplicator = SubmissionDeduplicator(max_size=2, window=60)
+        self.hash = SubmissionDeduplicator.content_hash({"foo": "bar"})
+
+    def test_content_hash_ignores_key_order(self):
+        self.assertEqual(SubmissionDeduplicator.content_hash({"a": 1, "b": 2}),
+                         SubmissionDeduplicator.content_hash({"b": 2, "a": 1}))
+
+    def test_should_skip_unchanged_submission(self):
+        self.deduplicator.remember("Xabcdefghij", self.hash)
+        self.assertTrue(self.deduplicator.is_duplicate("Xabcdefghij", self.hash))
+        self.assertEqual(self.deduplicator.skipped, 1)
+
+    def test_should_not_skip_changed_submission(self):
+        self.deduplicator.remember("Xabcdefghij", self.hash)
+        changed_hash = SubmissionDeduplicator.content_hash({"foo": "baz"})
+        self.assertFalse(self.deduplicator.is_duplicate("Xabcdefghij", changed_hash))
+        self.assertEqual(self.deduplicator.skipped, 0)
+
+    def test_should_not_skip_after_window(self):
+        with patch('meerkat_consul.dedup.time', return_value=1000):
+            self.deduplicator.remember("Xabcdefghij", self.hash)
+        with patch('meerkat_consul.dedup.time', return_value=1061):
+            self.assertFalse(self.deduplicator.is_duplicate("Xabcdefghij", self.hash))
+
+    def test_should_evict_least_recently_used(self):
+        self.deduplicator.remember("Xa", self.hash)
+        self.deduplicator.remember("Xb", self.hash)
+        self.deduplicator.is_duplicate("Xa", self.hash)
+        self.deduplicator.remember("Xc", self.hash)
+        self.assertEqual(len(self.deduplicator), 2)
+        self.assertFalse(self.deduplicator.is_duplicate("Xb", self.hash))
+        self.assertTrue(self.deduplicator.is_duplicate("Xa", self.hash))
+
+    def test_should_persist_and_load_entries(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            persistence_file = os.path.join(tmp_dir, "dedup.json")
+            deduplicator = SubmissionDeduplicator(window=60, persistence_file=persistence_file)
+            deduplicator.remember("Xabcdefghij", self.hash)
+            deduplicator.persist(force=True)
+
+            reloaded = SubmissionDeduplicator(window=60, persistence_file=persistence_file)
+            self.assertTrue(reloaded.is_duplicate("Xabcdefghij", self.hash))
+
+    def test_should_throttle_persisting(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            persistence_file = os.path.join(tmp_dir, "dedup.json")
+            deduplicator = SubmissionDeduplicator(window=60, persistence_file=persistence_file, persist_interval=60)
+            deduplicator.remember("Xabcdefghij", self.hash)
+            deduplicator.persist()
+            self.assertFalse(os.path.exists(persistence_file))
+            with patch('meerkat_consul.dedup.time', return_value=time() + 61):
+                deduplicator.persist()
+            self.assertTrue(os.path.exists(persistence_file))
+            self.assertEqual(os.listdir(tmp_dir), ["dedup.json"])
+
+    def test_concurrent_persists_should_leave_valid_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            persistence_file = os.path.join(tmp_dir, "dedup.json")
+            deduplicator = SubmissionDeduplicator(window=60, persistence_file=persistence_file)
+            for i in range(1000):
+                deduplicator.remember(f"X{i:010d}", self.hash)
+            threads = [threading.Thread(target=deduplicator.persist, kwargs={"force": True}) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            reloaded = SubmissionDeduplicator(window=60, persistence_file=persistence_file)
+            self.assertEqual(len(reloaded), 1000)
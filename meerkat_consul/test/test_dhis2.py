@@ -0,0 +1,45 @@
+from datetime import datetime
+from unittest import TestCase
+
+from meerkat_consul.dhis2 import coalesce_data_value_sets
+
+
+class CoalesceDataValueSetsTestCase(TestCase):
+    """
+    Unit tests for merging of aggregate data entries
+    """
+
+    def __entry(self, submitted_at, uid, org_unit, values, period="20180101"):
+        return submitted_at, uid, {
+            'dataSet': "ds",
+            'completeDate': submitted_at.strftime("%Y-%m-%d"),
+            'period': period,
+            'orgUnit': org_unit,
+            'dataValues': [{'dataElement': k, 'value': v} for k, v in values.items()]
+        }
+
+    def test_should_merge_entries_of_the_same_cell(self):
+        entries = [
+            self.__entry(datetime(2018, 1, 1, 10), "Xa", "ou1", {"de1": 1, "de2": 2}),
+            self.__entry(datetime(2018, 1, 1, 11), "Xb", "ou1", {"de2": 3, "de3": 4})
+        ]
+        result = coalesce_data_value_sets(entries)
+        self.assertEqual(len(result), 1)
+        values = {dv['dataElement']: dv['value'] for dv in result[0]['dataValues']}
+        self.assertEqual(values, {"de1": 1, "de2": 3, "de3": 4})
+
+    def test_last_submission_wins_regardless_of_order(self):
+        entries = [
+            self.__entry(datetime(2018, 1, 1, 11), "Xb", "ou1", {"de1": "late"}),
+            self.__entry(datetime(2018, 1, 1, 10), "Xa", "ou1", {"de1": "early"})
+        ]
+        result = coalesce_data_value_sets(entries)
+        self.assertEqual(result[0]['dataValues'], [{'dataElement': "de1", 'value': "late"}])
+
+    def test_should_keep_separate_org_units_and_periods(self):
+        entries = [
+            self.__entry(datetime(2018, 1, 1), "Xa", "ou1", {"de1": 1}),
+            self.__entry(datetime(2018, 1, 1), "Xb", "ou2", {"de1": 1}),
+            self.__entry(datetime(2018, 1, 2), "Xc", "ou1", {"de1": 1}, period="20180102")
+        ]
+        self.assertEqual(len(coalesce_data_value_sets(entries)), 3)
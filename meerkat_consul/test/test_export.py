@@ -1,13 +1,116 @@
+from datetime import datetime
 from unittest import TestCase
 
+from meerkat_consul.dhis2 import coalesce_data_value_sets
+from meerkat_consul.export import meerkat_date_to_datetime
+from meerkat_consul.location_tree import diff_location_tree, sort_parents_first, failed_import_ids
+
 
 class LocationTreeTestCase(TestCase):
 
     def setUp(self):
-        pass
+        self.locations = {
+            "3": {"id": 3, "name": "Clinic A", "parent_location": 2, "country_location_id": "CL_A"},
+            "1": {"id": 1, "name": "Demo", "parent_location": None},
+            "2": {"id": 2, "name": "Region", "parent_location": 1}
+        }
+        self.new_ids = iter(["NEW00000001", "NEW00000002", "NEW00000003"])
 
     def tearDown(self):
         pass
 
     def test_should_pass(self):
-        assert True
\ No newline at end of file
+        assert True
+
+    def test_should_sort_parents_before_children(self):
+        ordered = [location["id"] for location in sort_parents_first({1: self.locations["1"],
+                                                                       2: self.locations["2"],
+                                                                       3: self.locations["3"]})]
+        self.assertEqual(ordered, [1, 2, 3])
+
+    def test_should_create_missing_units_with_parents(self):
+        changed, codes_to_ids = diff_location_tree(self.locations, [], 1, new_id=lambda: next(self.new_ids))
+        self.assertEqual(len(changed), 3)
+        self.assertNotIn('parent', changed[0])
+        self.assertEqual(changed[1]['parent'], {'id': changed[0]['id']})
+        self.assertEqual(changed[2]['code'], "CL_A")
+        self.assertEqual(changed[2]['parent'], {'id': changed[1]['id']})
+        self.assertEqual(codes_to_ids["CL_A"], changed[2]['id'])
+
+    def test_should_only_update_changed_units(self):
+        created, codes_to_ids = diff_location_tree(self.locations, [], 1, new_id=lambda: next(self.new_ids))
+        self.locations["3"]["name"] = "Clinic A renamed"
+        changed, _ = diff_location_tree(self.locations, created, 1, new_id=lambda: next(self.new_ids))
+        self.assertEqual([unit['code'] for unit in changed], ["CL_A"])
+        self.assertEqual(changed[0]['id'], codes_to_ids["CL_A"])
+
+    def test_should_move_units_between_managed_parents(self):
+        created, codes_to_ids = diff_location_tree(self.locations, [], 1, new_id=lambda: next(self.new_ids))
+        self.locations["3"]["parent_location"] = 1
+        changed, _ = diff_location_tree(self.locations, created, 1, new_id=lambda: next(self.new_ids))
+        self.assertEqual([unit['code'] for unit in changed], ["CL_A"])
+        self.assertEqual(changed[0]['parent'], {'id': codes_to_ids[created[0]['code']]})
+
+    def test_should_map_country_to_existing_root_and_keep_manual_hierarchy(self):
+        dhis2_units = [
+            {"id": "ROOT0000001", "code": "MANUAL_COUNTRY", "name": "Demo country"},
+            {"id": "DISTRICT001", "code": "MANUAL_DISTRICT", "name": "District", "parent": {"id": "ROOT0000001"}},
+            {"id": "CLINIC00001", "code": "CL_A", "name": "Clinic A", "parent": {"id": "DISTRICT001"}}
+        ]
+        changed, codes_to_ids = diff_location_tree(self.locations, dhis2_units, 1, new_id=lambda: next(self.new_ids))
+        self.assertEqual(changed, [])
+        self.assertEqual(codes_to_ids["CL_A"], "CLINIC00001")
+
+    def test_should_create_new_clinic_under_existing_root(self):
+        self.locations["4"] = {"id": 4, "name": "Clinic B", "parent_location": 2, "country_location_id": "CL_B"}
+        dhis2_units = [
+            {"id": "ROOT0000001", "code": "MANUAL_COUNTRY", "name": "Demo country"},
+            {"id": "CLINIC00001", "code": "CL_A", "name": "Clinic A", "parent": {"id": "ROOT0000001"}}
+        ]
+        changed, _ = diff_location_tree(self.locations, dhis2_units, 1, new_id=lambda: next(self.new_ids))
+        self.assertEqual([unit['name'] for unit in changed], ["Region", "Clinic B"])
+        self.assertEqual(changed[0]['parent'], {'id': "ROOT0000001"})
+        self.assertEqual(changed[1]['parent'], {'id': changed[0]['id']})
+
+    def test_should_keep_manual_hierarchy_after_creating_meerkat_parents(self):
+        self.locations["4"] = {"id": 4, "name": "Clinic B", "parent_location": 2, "country_location_id": "CL_B"}
+        dhis2_units = [
+            {"id": "ROOT0000001", "code": "MANUAL_COUNTRY", "name": "Demo country"},
+            {"id": "DISTRICT001", "code": "MANUAL_DISTRICT", "name": "District", "parent": {"id": "ROOT0000001"}},
+            {"id": "CLINIC00001", "code": "CL_A", "name": "Clinic A", "parent": {"id": "DISTRICT001"}}
+        ]
+        first_sync, _ = diff_location_tree(self.locations, dhis2_units, 1, new_id=lambda: next(self.new_ids))
+        self.assertEqual([unit['name'] for unit in first_sync], ["Region", "Clinic B"])
+        second_sync, codes_to_ids = diff_location_tree(self.locations, dhis2_units + first_sync, 1,
+                                                       new_id=lambda: next(self.new_ids))
+        self.assertEqual(second_sync, [])
+        self.assertEqual(codes_to_ids["CL_A"], "CLINIC00001")
+
+    def test_should_report_rejected_units(self):
+        import_report = {"status": "WARNING", "typeReports": [{"objectReports": [
+            {"uid": "NEW00000001", "errorReports": [{"message": "Property `name` is required"}]},
+            {"uid": "NEW00000002", "errorReports": []}
+        ]}]}
+        self.assertEqual(failed_import_ids(import_report), {"NEW00000001"})
+
+
+class SubmissionDateTestCase(TestCase):
+
+    def test_should_parse_twelve_hour_clock(self):
+        self.assertEqual(meerkat_date_to_datetime("Jan 1, 2018 01:00:00 PM"), datetime(2018, 1, 1, 13))
+        self.assertEqual(meerkat_date_to_datetime("Jan 1, 2018 12:30:00 AM"), datetime(2018, 1, 1, 0, 30))
+        self.assertEqual(meerkat_date_to_datetime("Jan 1, 2018 13:00:00 PM"), datetime(2018, 1, 1, 13))
+
+    def test_pm_submission_should_win_over_am_submission(self):
+        entries = []
+        for uid, submission_date, value in [("Xb", "Jan 1, 2018 01:00:00 PM", "afternoon"),
+                                            ("Xa", "Jan 1, 2018 11:00:00 AM", "morning")]:
+            entries.append((meerkat_date_to_datetime(submission_date), uid, {
+                'dataSet': "ds",
+                'completeDate': "2018-01-01",
+                'period': "20180101",
+                'orgUnit': "ou1",
+                'dataValues': [{'dataElement': "de1", 'value': value}]
+            }))
+        result = coalesce_data_value_sets(entries)
+        self.assertEqual(result[0]['dataValues'], [{'dataElement': "de1", 'value': "afternoon"}])
@@ -0,0 +1,95 @@
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from meerkat_consul.log_handlers import SamplingFilter, StructuredFormatter, queue_handler
+
+
+class SamplingFilterTestCase(TestCase):
+    """
+    Unit tests for rate limiting and sampling of log records
+    """
+
+    def __record(self, msg, level=logging.INFO):
+        return logging.LogRecord("meerkat_consul", level, __file__, 1, msg, ("arg",), None)
+
+    def test_should_rate_limit_per_template(self):
+        sampling_filter = SamplingFilter(rate_limit=2, interval=60)
+        results = [sampling_filter.filter(self.__record("Cache miss %s")) for _ in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertTrue(sampling_filter.filter(self.__record("Other message %s")))
+
+    def test_should_report_suppressed_records_in_next_window(self):
+        sampling_filter = SamplingFilter(rate_limit=1, interval=60)
+        with patch('meerkat_consul.log_handlers.time', return_value=0):
+            sampling_filter.filter(self.__record("Cache miss %s"))
+            sampling_filter.filter(self.__record("Cache miss %s"))
+            sampling_filter.filter(self.__record("Cache miss %s"))
+        record = self.__record("Cache miss %s")
+        with patch('meerkat_consul.log_handlers.time', return_value=61):
+            self.assertTrue(sampling_filter.filter(record))
+        self.assertEqual(record.suppressed, 2)
+
+    def test_should_never_drop_warnings(self):
+        sampling_filter = SamplingFilter(rate_limit=1, interval=60, sample_rates={"Failed %s": 0})
+        for _ in range(3):
+            self.assertTrue(sampling_filter.filter(self.__record("Failed %s", logging.ERROR)))
+
+    def test_should_sample_configured_templates(self):
+        sampling_filter = SamplingFilter(rate_limit=0, sample_rates={"Message: %s": 0})
+        self.assertFalse(sampling_filter.filter(self.__record("Message: %s")))
+
+    def test_should_cap_tracked_templates(self):
+        sampling_filter = SamplingFilter(rate_limit=10, interval=60, max_templates=100)
+        for i in range(10000):
+            sampling_filter.filter(self.__record(f"Starting background tasks with id: {i}"))
+        self.assertLessEqual(sampling_filter.tracked_templates(), 100)
+
+    def test_should_evict_expired_windows_first(self):
+        sampling_filter = SamplingFilter(rate_limit=1, interval=60, max_templates=2)
+        with patch('meerkat_consul.log_handlers.time', return_value=0):
+            sampling_filter.filter(self.__record("Old %s"))
+        with patch('meerkat_consul.log_handlers.time', return_value=30):
+            sampling_filter.filter(self.__record("Recent %s"))
+        with patch('meerkat_consul.log_handlers.time', return_value=61):
+            sampling_filter.filter(self.__record("New %s"))
+            self.assertFalse(sampling_filter.filter(self.__record("Recent %s")))
+
+
+class StructuredFormatterTestCase(TestCase):
+
+    def test_should_append_fields(self):
+        record = logging.LogRecord("meerkat_consul", logging.INFO, __file__, 1, "Batch done", None, None)
+        record.fields = {"form": "demo_case", "exported": 3}
+        self.assertEqual(StructuredFormatter("%(message)s").format(record), "Batch done form=demo_case exported=3")
+
+
+class ProcessLocalQueueHandlerTestCase(TestCase):
+
+    def __emit(self, handler, messages, level=logging.WARNING):
+        test_logger = logging.getLogger("meerkat_consul.test.queue")
+        test_logger.setLevel(logging.DEBUG)
+        test_logger.addHandler(handler)
+        test_logger.propagate = False
+        try:
+            for message in messages:
+                test_logger.log(level, message, "record")
+            handler.close()
+        finally:
+            test_logger.removeHandler(handler)
+
+    def test_should_start_listener_on_first_emit(self):
+        records = []
+        target = logging.Handler()
+        target.emit = records.append
+        self.__emit(queue_handler(target), ["Queued %s"])
+        self.assertEqual([record.getMessage() for record in records], ["Queued record"])
+
+    def test_should_attach_new_sampling_filter(self):
+        records = []
+        target = logging.Handler()
+        target.emit = records.append
+        handler = queue_handler(target, SamplingFilter(rate_limit=1))
+        self.assertEqual(len(handler.filters), 1)
+        self.__emit(handler, ["Queued %s"] * 3, level=logging.INFO)
+        self.assertEqual([record.getMessage() for record in records], ["Queued record"])
@@ -0,0 +1,84 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import meerkat_consul.export as export
+from meerkat_consul.dhis2 import transform_to_dhis2_code
+
+
+class ReloadFormConfigTestCase(TestCase):
+    """
+    Unit tests for incremental re-export of changed forms
+    """
+
+    def setUp(self):
+        self.definitions = {
+            "form_a": [{"name": "field_a", "type": "TEXT"}],
+            "form_b": [{"name": "field_b", "type": "TEXT"}],
+            "form_c": [{"name": "field_c", "type": "TEXT"}]
+        }
+        self.export_config = {
+            "form_a": {"exportType": "event"},
+            "form_b": {"exportType": "data_set"},
+            "form_c": {"exportType": "event"}
+        }
+        fingerprints = {name: export.form_fingerprint(self.definitions[name], config)
+                        for name, config in self.export_config.items()}
+        caches = {
+            'programs': {transform_to_dhis2_code(name): f"P_{name}" for name in self.definitions},
+            'dataSets': {transform_to_dhis2_code("form_b"): "DS_form_b"},
+            'dataElements': {transform_to_dhis2_code(f"{domain}_{field[0]['name']}"): f"DE_{field[0]['name']}"
+                             for field in self.definitions.values() for domain in ("TRACKER", "AGGREGATE")}
+        }
+        patchers = [
+            patch.dict(export.form_export_config, self.export_config, clear=True),
+            patch.dict(export.form_fingerprints, fingerprints, clear=True),
+            patch.dict(export.exported_form_definitions, self.definitions, clear=True),
+            patch.dict(export.Dhis2CodesToIdsCache.caches, caches, clear=True),
+            patch.object(export.app.config, 'from_pyfile'),
+            patch('meerkat_consul.export.export_form_fields')
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.export_form_fields_mock = export.export_form_fields
+
+    def __reload(self, definitions, export_config):
+        with patch.dict(export.app.config, {"FORM_DEFINITIONS": definitions, "FORM_EXPORT_CONFIG": export_config}):
+            return export.reload_form_config()
+
+    def test_fingerprint_should_change_with_definition_and_config(self):
+        fingerprint = export.form_fingerprint(self.definitions["form_a"], self.export_config["form_a"])
+        self.assertEqual(fingerprint, export.form_fingerprint([{"type": "TEXT", "name": "field_a"}],
+                                                              {"exportType": "event"}))
+        self.assertNotEqual(fingerprint, export.form_fingerprint(self.definitions["form_a"],
+                                                                 {"exportType": "data_set"}))
+        self.assertNotEqual(fingerprint, export.form_fingerprint(self.definitions["form_b"],
+                                                                 self.export_config["form_a"]))
+
+    def test_should_not_export_unchanged_forms(self):
+        changed = self.__reload(dict(self.definitions), dict(self.export_config))
+        self.assertEqual(changed, [])
+        self.export_form_fields_mock.assert_called_once_with([], self.definitions)
+        self.assertEqual(len(export.Dhis2CodesToIdsCache.caches['programs']), 3)
+
+    def test_should_export_only_changed_forms(self):
+        definitions = dict(self.definitions, form_b=[{"name": "field_b2", "type": "TEXT"}])
+        changed = self.__reload(definitions, dict(self.export_config))
+        self.assertEqual(changed, ["form_b"])
+        self.export_form_fields_mock.assert_called_once_with(["form_b"], definitions)
+
+    def test_should_drop_removed_forms(self):
+        export_config = {name: config for name, config in self.export_config.items() if name != "form_c"}
+        self.__reload(dict(self.definitions), export_config)
+        self.assertNotIn("form_c", export.form_export_config)
+        self.assertNotIn("form_c", export.form_fingerprints)
+        self.assertNotIn("form_c", export.exported_form_definitions)
+
+    def test_should_invalidate_only_affected_cache_entries(self):
+        definitions = dict(self.definitions, form_b=[{"name": "field_b2", "type": "TEXT"}])
+        export_config = {name: config for name, config in self.export_config.items() if name != "form_c"}
+        self.__reload(definitions, export_config)
+        caches = export.Dhis2CodesToIdsCache.caches
+        self.assertEqual(set(caches['programs'].values()), {"P_form_a"})
+        self.assertEqual(caches['dataSets'], {})
+        self.assertEqual(set(caches['dataElements'].values()), {"DE_field_a"})
@@ -0,0 +1,113 @@
+import importlib.util
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from meerkat_consul.capture import SubmissionRecorder
+
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'scripts', 'replay_submissions.py')
+spec = importlib.util.spec_from_file_location('replay_submissions', SCRIPT_PATH)
+replay_submissions = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(replay_submissions)
+
+
+class StubSender:
+
+    def __init__(self, response=None, error=None):
+        self.response = response or {}
+        self.error = error
+        self.bodies = []
+
+    def send(self, body):
+        self.bodies.append(body)
+        if self.error:
+            raise self.error
+        return 200, self.response
+
+
+class ReplaySubmissionsTestCase(TestCase):
+    """
+    Unit tests for replaying captured submission batches
+    """
+
+    def __batch(self, count, captured_at=None):
+        return {"time": captured_at, "body": json.dumps({"Messages": [{"Body": "{}"}] * count})}
+
+    def test_should_count_messages(self):
+        self.assertEqual(replay_submissions.count_messages(json.dumps({"Messages": [{}, {}]})), 2)
+        self.assertEqual(replay_submissions.count_messages("not json"), 0)
+        self.assertEqual(replay_submissions.count_messages(None), 0)
+        self.assertEqual(replay_submissions.count_messages("[]"), 0)
+
+    def test_should_summarize_latencies_and_throughput(self):
+        results = [{"latency": latency / 10, "messages": 2, "status": 200, "skipped": {"duplicate": 1}}
+                   for latency in range(1, 11)]
+        results[-1]["status"] = None
+        summary = replay_submissions.summarize(results, elapsed=2)
+        self.assertEqual(summary["batches"], 10)
+        self.assertEqual(summary["messages"], 20)
+        self.assertEqual(summary["batches_per_second"], 5)
+        self.assertEqual(summary["messages_per_second"], 10)
+        self.assertEqual(summary["latency_p50"], 0.6)
+        self.assertEqual(summary["latency_p95"], 1.0)
+        self.assertEqual(summary["latency_max"], 1.0)
+        self.assertEqual(summary["statuses"], {"200": 9, "None": 1})
+        self.assertEqual(summary["skipped"], {"duplicate": 10})
+
+    def test_should_summarize_empty_replay(self):
+        summary = replay_submissions.summarize([], elapsed=0)
+        self.assertEqual(summary["batches"], 0)
+        self.assertIsNone(summary["latency_p50"])
+        self.assertIsNone(summary["batches_per_second"])
+
+    def test_should_pace_batches_with_fixed_rate(self):
+        sender = StubSender()
+        with patch.object(replay_submissions, 'sleep') as sleep_mock:
+            summary = replay_submissions.replay([self.__batch(1) for _ in range(3)], sender, rate=10,
+                                                out=io.StringIO())
+        delays = [call[0][0] for call in sleep_mock.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 0.1, delta=0.05)
+        self.assertAlmostEqual(delays[1], 0.2, delta=0.05)
+        self.assertEqual(summary["batches"], 3)
+        self.assertEqual(len(sender.bodies), 3)
+
+    def test_should_compress_captured_inter_arrival_times(self):
+        batches = [self.__batch(1, captured_at) for captured_at in (100, 130, 160)]
+        with patch.object(replay_submissions, 'sleep') as sleep_mock:
+            replay_submissions.replay(batches, StubSender(), time_compression=10, out=io.StringIO())
+        delays = [call[0][0] for call in sleep_mock.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 3, delta=0.05)
+        self.assertAlmostEqual(delays[1], 6, delta=0.05)
+
+    def test_should_report_sender_errors(self):
+        out = io.StringIO()
+        sender = StubSender(error=ConnectionError("refused"))
+        summary = replay_submissions.replay([self.__batch(2)], sender, out=out)
+        self.assertEqual(summary["statuses"], {"None": 1})
+        self.assertEqual(json.loads(out.getvalue())["messages"], 2)
+
+    def test_should_collect_skipped_submissions(self):
+        sender = StubSender(response={"skipped": {"duplicate": 2}})
+        summary = replay_submissions.replay([self.__batch(2), self.__batch(2)], sender, out=io.StringIO())
+        self.assertEqual(summary["skipped"], {"duplicate": 4})
+
+
+class SubmissionRecorderTestCase(TestCase):
+    """
+    Unit tests for capturing submission batches
+    """
+
+    def test_should_write_one_line_per_batch(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            capture_file = os.path.join(tmp_dir, "captured.jsonl")
+            recorder = SubmissionRecorder(capture_file)
+            recorder.record('{"Messages": []}')
+            recorder.record({"Messages": [{"Body": "{}"}]})
+            batches = list(replay_submissions.read_batches(capture_file))
+        self.assertEqual([batch["body"] for batch in batches], ['{"Messages": []}', {"Messages": [{"Body": "{}"}]}])
+        self.assertTrue(all(isinstance(batch["time"], float) for batch in batches))
@@ -0,0 +1,70 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from meerkat_consul.errors import CircuitOpenError
+from meerkat_consul.throttle import AdaptiveConcurrencyLimiter
+
+
+class AdaptiveConcurrencyLimiterTestCase(TestCase):
+    """
+    Unit tests for the AIMD concurrency limiter
+    """
+
+    def setUp(self):
+        self.limiter = AdaptiveConcurrencyLimiter(floor=1, ceiling=4, initial=2, latency_target=1.0,
+                                                  decrease_cooldown=0)
+
+    def __response(self, status_code):
+        response = MagicMock('requests.Response')
+        response.status_code = status_code
+        return response
+
+    def test_should_increase_limit_on_fast_success(self):
+        for _ in range(10):
+            self.limiter.call(lambda: self.__response(200))
+        self.assertEqual(self.limiter.status()["limit"], 4)
+        self.assertEqual(self.limiter.status()["in_flight"], 0)
+
+    def test_should_halve_limit_on_server_errors(self):
+        self.limiter.limit = 4
+        self.limiter.call(lambda: self.__response(503))
+        self.assertEqual(self.limiter.status()["limit"], 2)
+        self.limiter.call(lambda: self.__response(429))
+        self.assertEqual(self.limiter.status()["limit"], 1)
+        self.limiter.call(lambda: self.__response(500))
+        self.assertEqual(self.limiter.status()["limit"], 1)
+
+    def test_should_decrease_limit_on_slow_response(self):
+        self.limiter.limit = 4
+        with patch('meerkat_consul.throttle.time', side_effect=[0, 10, 10, 10]):
+            self.limiter.call(lambda: self.__response(200))
+        self.assertEqual(self.limiter.status()["limit"], 2)
+        self.assertIn("latency", self.limiter.status()["adjustments"][-1]["reason"])
+
+    def test_should_decrease_limit_and_reraise_on_connection_error(self):
+        self.limiter.limit = 4
+
+        def failing_request():
+            raise requests.exceptions.ConnectionError()
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.limiter.call(failing_request)
+        self.assertEqual(self.limiter.status()["limit"], 2)
+        self.assertEqual(self.limiter.status()["in_flight"], 0)
+
+    def test_should_reject_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            AdaptiveConcurrencyLimiter(floor=5, ceiling=2)
+
+    def test_should_not_decrease_limit_when_circuit_is_open(self):
+        self.limiter.limit = 4
+
+        def rejected_request():
+            raise CircuitOpenError("Circuit breaker for dhis2 is open")
+
+        with self.assertRaises(CircuitOpenError):
+            self.limiter.call(rejected_request)
+        self.assertEqual(self.limiter.status()["limit"], 4)
+        self.assertEqual(self.limiter.status()["in_flight"], 0)
@@ -0,0 +1,110 @@
+import threading
+from collections import deque
+from time import time
+
+from meerkat_consul import logger
+from meerkat_consul.errors import CircuitOpenError
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limiter for requests to an upstream service.
+
+    The limit grows additively (by roughly `increase_step` per round trip) while requests succeed
+    within `latency_target` seconds and is cut by `decrease_factor` on 5xx/429 responses,
+    connection errors or slow responses. Decreases happen at most once per `decrease_cooldown`
+    seconds so a burst of failures from the same window only backs off once.
+    """
+
+    def __init__(self, floor=1, ceiling=20, initial=None, latency_target=5.0,
+                 increase_step=1.0, decrease_factor=0.5, decrease_cooldown=None, history_size=50):
+        if floor < 1 or ceiling < floor:
+            raise ValueError(f"Invalid concurrency bounds: floor {floor}, ceiling {ceiling}")
+        self.floor = floor
+        self.ceiling = ceiling
+        self.latency_target = latency_target
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = latency_target if decrease_cooldown is None else decrease_cooldown
+        self.limit = float(initial if initial is not None else floor)
+        self.in_flight = 0
+        self.adjustments = deque(maxlen=history_size)
+        self.__last_decrease = 0
+        self.__condition = threading.Condition()
+
+    def acquire(self):
+        with self.__condition:
+            while self.in_flight >= int(self.limit):
+                self.__condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, status_code=None, adjust=True):
+        with self.__condition:
+            self.in_flight -= 1
+            if adjust:
+                self.__adjust(latency, status_code)
+            self.__condition.notify_all()
+
+    def call(self, f, *args, **kwargs):
+        """
+        Runs request function `f` within a concurrency slot and feeds the outcome back to the limiter.
+        Requests rejected by an open circuit breaker never reached the upstream service and leave the limit as is.
+        :return: requests.Response returned by `f`
+        """
+        self.acquire()
+        start = time()
+        status_code = None
+        adjust = True
+        try:
+            response = f(*args, **kwargs)
+            status_code = response.status_code
+            return response
+        except CircuitOpenError:
+            adjust = False
+            raise
+        finally:
+            self.release(time() - start, status_code, adjust)
+
+    def status(self):
+        with self.__condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "floor": self.floor,
+                "ceiling": self.ceiling,
+                "adjustments": list(self.adjustments)
+            }
+
+    def __adjust(self, latency, status_code):
+        if status_code is None or status_code == 429 or status_code >= 500:
+            self.__decrease(f"status {status_code}" if status_code else "connection error")
+        elif latency > self.latency_target:
+            self.__decrease(f"latency {latency:.2f}s")
+        else:
+            self.__increase()
+
+    def __increase(self):
+        old_limit = self.limit
+        self.limit = min(self.ceiling, self.limit + self.increase_step / max(self.limit, 1))
+        if int(self.limit) != int(old_limit):
+            self.__record(old_limit, "increase")
+
+    def __decrease(self, reason):
+        now = time()
+        if now - self.__last_decrease < self.decrease_cooldown:
+            return
+        self.__last_decrease = now
+        old_limit = self.limit
+        self.limit = max(self.floor, self.limit * self.decrease_factor)
+        if int(self.limit) != int(old_limit):
+            self.__record(old_limit, reason)
+            logger.warning("Decreased concurrency limit from %d to %d because of %s",
+                           old_limit, self.limit, reason)
+
+    def __record(self, old_limit, reason):
+        self.adjustments.append({
+            "time": time(),
+            "from": int(old_limit),
+            "to": int(self.limit),
+            "reason": reason
+        })
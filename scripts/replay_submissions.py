@@ -0,0 +1,171 @@
+"""
+Replays submission batches captured with CAPTURE_SUBMISSIONS_FILE into the export pipeline.
+
+Batches are either posted over HTTP to a running consul (--url) or sent in-process through the
+Flask test client (--in-process). Per-batch latency, skipped submissions and overall throughput
+are reported on stdout.
+
+Usage:
+    python scripts/replay_submissions.py captured.jsonl --url http://localhost:5000 --concurrency 4
+    python scripts/replay_submissions.py captured.jsonl --in-process --time-compression 60
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+
+# In-process replays import meerkat_consul and the top-level config module from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SUBMISSIONS_PATH = '/dhis2/export/submissions'
+
+
+def read_batches(capture_file):
+    with open(capture_file) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def count_messages(body):
+    try:
+        return len(json.loads(body).get('Messages', []))
+    except (TypeError, ValueError, AttributeError):
+        return 0
+
+
+class HttpSender:
+    def __init__(self, url, headers):
+        import requests
+        self.session = requests.Session()
+        self.url = url.rstrip('/') + SUBMISSIONS_PATH
+        self.headers = headers
+
+    def send(self, body):
+        response = self.session.post(self.url, json=body, headers=self.headers)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, {}
+
+
+class InProcessSender:
+    def __init__(self, headers):
+        from meerkat_consul import app
+        self.app = app
+        self.headers = headers
+        self.__clients = threading.local()
+
+    def send(self, body):
+        if not hasattr(self.__clients, 'client'):
+            self.__clients.client = self.app.test_client()
+        response = self.__clients.client.post(SUBMISSIONS_PATH, json=body, headers=self.headers)
+        return response.status_code, response.get_json() or {}
+
+
+def replay(batches, sender, rate=None, concurrency=1, time_compression=None, out=sys.stdout):
+    """
+    Sends batches with given sender, pacing them either with a fixed `rate` (batches per second)
+    or by the captured inter-arrival times divided by `time_compression`.
+    :return: summary dict
+    """
+    results = []
+    results_lock = threading.Lock()
+
+    def send(index, batch):
+        body = batch['body']
+        start = time()
+        try:
+            status_code, response = sender.send(body)
+        except Exception as e:
+            status_code, response = None, {"message": str(e)}
+        latency = time() - start
+        skipped = response.get('skipped', {}) if isinstance(response, dict) else {}
+        result = {
+            "batch": index,
+            "status": status_code,
+            "latency": latency,
+            "messages": count_messages(body),
+            "skipped": skipped
+        }
+        with results_lock:
+            results.append(result)
+        print(json.dumps(result), file=out)
+
+    replay_start = time()
+    first_captured_at = None
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, batch in enumerate(batches):
+            if rate:
+                due = replay_start + index / rate
+            elif time_compression and batch.get('time') is not None:
+                if first_captured_at is None:
+                    first_captured_at = batch['time']
+                due = replay_start + (batch['time'] - first_captured_at) / time_compression
+            else:
+                due = time()
+            delay = due - time()
+            if delay > 0:
+                sleep(delay)
+            executor.submit(send, index, batch)
+    return summarize(results, time() - replay_start)
+
+
+def summarize(results, elapsed):
+    latencies = sorted(result['latency'] for result in results)
+    skipped = Counter()
+    statuses = Counter()
+    for result in results:
+        skipped.update(result['skipped'])
+        statuses[str(result['status'])] += 1
+    messages = sum(result['messages'] for result in results)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        "batches": len(results),
+        "messages": messages,
+        "elapsed": elapsed,
+        "batches_per_second": len(results) / elapsed if elapsed else None,
+        "messages_per_second": messages / elapsed if elapsed else None,
+        "latency_p50": percentile(0.5),
+        "latency_p95": percentile(0.95),
+        "latency_max": latencies[-1] if latencies else None,
+        "statuses": dict(statuses),
+        "skipped": dict(skipped)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured submission batches.")
+    parser.add_argument('capture_file', help="JSONL file written by CAPTURE_SUBMISSIONS_FILE")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help="Base url of a running consul, e.g. http://localhost:5000")
+    target.add_argument('--in-process', action='store_true', help="Send batches through the Flask test client")
+    parser.add_argument('--authorization', help="Value of the Authorization header sent with each batch")
+    parser.add_argument('--rate', type=float, help="Batches per second, overrides captured timing")
+    parser.add_argument('--concurrency', type=int, default=1, help="Number of batches sent in parallel")
+    parser.add_argument('--time-compression', type=float,
+                        help="Replay captured inter-arrival times this many times faster")
+    args = parser.parse_args(argv)
+
+    headers = {'Authorization': args.authorization} if args.authorization else {}
+    if args.in_process:
+        sender = InProcessSender(headers)
+    else:
+        sender = HttpSender(args.url, headers)
+    summary = replay(read_batches(args.capture_file), sender, rate=args.rate, concurrency=args.concurrency,
+                     time_compression=args.time_compression)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()